@@ -0,0 +1,423 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+asyncio runtime for the QuietDash.io display client
+Runs every panel's update loop, token renewal, push stream and the systemd watchdog ping as tasks
+of one event loop, with aiohttp as HTTP client. Blocking work stays off the loop: panel (SPI)
+calls go to one dedicated thread, image decoding and conversion to the default executor.
+
+Enabled with QUIETDASH_ASYNC=1 (needs aiohttp); the threaded loops stay the default.
+"""
+
+import os
+import time
+import zlib
+import socket
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from token_manager import TOKEN_RETRY_INTERVAL, renewal_due_at, token_is_fresh
+from push_listener import PUSH_READ_TIMEOUT, PUSH_RETRY_INTERVAL, PUSH_UNAVAILABLE_RETRY_INTERVAL, SseLineSplitter, SseParser
+
+# Response bodies are read (and inflated) in chunks of this size
+READ_CHUNK = 64 * 1024
+
+# Request timeouts in seconds, as in the threaded client
+LOGIN_TIMEOUT = aiohttp.ClientTimeout(total=10)
+IMAGE_TIMEOUT = aiohttp.ClientTimeout(total=30)
+EVENTS_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=PUSH_READ_TIMEOUT)
+
+
+async def read_body(response, buffer):
+    """
+    Stream an aiohttp response opened with auto_decompress=False into a DownloadBuffer
+
+    gzip/deflate bodies are inflated chunk by chunk, so the buffer's size limit also
+    bounds the decompressed size.
+
+    Returns:
+        (memoryview of the content-decoded body, bytes transferred)
+    """
+    encoding = response.headers.get('Content-Encoding', 'identity')
+    if encoding in ('gzip', 'deflate'):
+        # 32 + MAX_WBITS accepts both gzip and zlib-wrapped deflate streams
+        inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        buffer.start()
+    elif encoding == 'identity':
+        inflater = None
+        buffer.start(response.content_length)
+    else:
+        raise ValueError(f"Unsupported Content-Encoding {encoding}")
+
+    wire_bytes = 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK):
+        wire_bytes += len(chunk)
+        if inflater is None:
+            buffer.append(chunk)
+            continue
+        while chunk:
+            buffer.append(inflater.decompress(chunk, READ_CHUNK))
+            chunk = inflater.unconsumed_tail
+    if inflater is not None:
+        buffer.append(inflater.flush())
+    return buffer.view(), wire_bytes
+
+
+def sd_notify(message):
+    """
+    Send a state update (e.g. 'READY=1', 'WATCHDOG=1') to systemd
+
+    Returns:
+        True if sent, False when not running under systemd with a notify socket
+    """
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # Abstract namespace socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode())
+        return True
+    except OSError as e:
+        logging.warning(f"Could not notify systemd: {e}")
+        return False
+
+
+class AsyncPanel:
+    """Drives one QuietDashDisplay from the event loop (create it inside the running loop)"""
+
+    def __init__(self, runtime, display, login_lock=None):
+        """
+        Args:
+            runtime: AsyncRuntime owning the HTTP session and executors
+            display: QuietDashDisplay (its own token renewal and push threads are not started)
+            login_lock: asyncio.Lock shared by the panels logging in with the same account
+        """
+        self.runtime = runtime
+        self.display = display
+        self.login_lock = login_lock or asyncio.Lock()
+        # Set by the event stream when the server signals new content
+        self.changed = asyncio.Event()
+        self.push_connected = False
+
+    async def login(self):
+        """Authenticate with the API and cache the access token (call with login_lock held)"""
+        display = self.display
+        url = f'{self.runtime.api_url}/auth/login'
+        logging.info(f"Logging in to {url}")
+        try:
+            with display.metrics.timer('login'):
+                async with self.runtime.http.post(
+                    url,
+                    json={'email': display.email, 'password': display.password},
+                    headers={'Accept': 'application/json'},
+                    timeout=LOGIN_TIMEOUT,
+                ) as response:
+                    if response.status >= 400:
+                        logging.error(f"Login failed with status {response.status}: {await response.text()}")
+                        return False
+                    data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"Authentication failed: {e}")
+            return False
+
+        token = data.get('accessToken') if isinstance(data, dict) else None
+        if not token:
+            logging.error("No accessToken in response")
+            return False
+        display.access_token = token
+        display.token_cache.save(self.runtime.api_url, display.email, token)
+        logging.info("Successfully authenticated")
+        return True
+
+    async def ensure_token(self):
+        """Make sure a usable access token is available, logging in only if needed"""
+        if token_is_fresh(self.display.access_token):
+            return True
+        async with self.login_lock:
+            # Another task, panel or process may have logged in while we waited for the lock
+            if self.display.tokens.reload():
+                return True
+            return await self.login()
+
+    async def fetch_image(self):
+        """Async counterpart of QuietDashDisplay.fetch_image, with the same return values"""
+        display = self.display
+        if not await self.ensure_token():
+            return None
+
+        url = f'{self.runtime.api_url}/display/image'
+        logging.info(f"Fetching display image from {url}")
+        try:
+            for attempt in range(2):
+                headers = display.image_request_headers()
+                with display.metrics.timer('http'):
+                    response = await self.runtime.http.get(
+                        url, params=display.image_request_params(), headers=headers,
+                        timeout=IMAGE_TIMEOUT, auto_decompress=False,
+                    )
+                async with response:
+                    # If unauthorized, try to re-login once
+                    if response.status == 401 and attempt == 0:
+                        logging.warning("Token rejected, re-authenticating...")
+                        display.token_cache.save(self.runtime.api_url, display.email, None)
+                        async with self.login_lock:
+                            if not await self.login():
+                                return None
+                        continue
+                    if response.status == 304:
+                        return display.not_modified()
+                    response.raise_for_status()
+
+                    with display.metrics.timer('download'):
+                        body, wire_bytes = await read_body(response, display.download_buffer)
+                    # Decoding is CPU work (PNG inflate, delta patching), keep it off the event loop
+                    return await asyncio.get_running_loop().run_in_executor(
+                        None, display.decode_image, body, response.headers, wire_bytes,
+                        'X-QuietDash-Base-Frame' in headers,
+                    )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Failed to fetch image: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Failed to process image: {e}")
+            return None
+
+    async def prepare_frame(self):
+        """Async counterpart of QuietDashDisplay.prepare_api_frame"""
+        display = self.display
+        with display.metrics.timer('prepare'):
+            if not display.breaker.allow_request():
+                logging.info(f"API marked unavailable, next attempt in {display.breaker.time_until_retry():.0f}s")
+                return None
+            image = await self.fetch_image()
+            return await asyncio.get_running_loop().run_in_executor(None, display.prepare_fetched_frame, image)
+
+    async def show(self, frame):
+        """Push a prepared frame (or the fallback) to the panel on the panel I/O thread"""
+        await asyncio.get_running_loop().run_in_executor(
+            self.runtime.panel_io, self.runtime.update, self.display, frame,
+        )
+
+    async def wait_for_push(self, deadline):
+        """
+        Sleep until a monotonic deadline, or until the server pushes new content
+
+        Returns:
+            True if woken up by a push event
+        """
+        try:
+            await asyncio.wait_for(self.changed.wait(), max(0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            return False
+        self.changed.clear()
+        return True
+
+    async def update_loop(self):
+        """
+        Poll and refresh on the display's schedule
+
+        With a prefetch lead, the next frame is fetched and converted that many seconds before
+        its deadline, so the refresh itself is only a buffer push at the scheduled time.
+        """
+        display = self.display
+        lead = self.runtime.prefetch_lead
+        deadline = time.monotonic()
+        while True:
+            started = time.monotonic()
+            frame = await self.prepare_frame()
+            if lead > 0:
+                await asyncio.sleep(max(0, deadline - time.monotonic()))
+                started = time.monotonic()
+            await self.show(frame)
+            display.record_update_time(time.monotonic() - started)
+
+            # Counted from this update's deadline so fetch and refresh time do not add up to a drift;
+            # refreshes missed while the panel was busy are not caught up on
+            deadline = display.next_update_at(deadline)
+            logging.info(f"Next update of {self.describe()} in {max(0, deadline - time.monotonic()):.0f} seconds")
+            if await self.wait_for_push(deadline - lead):
+                # Pushed content is shown as soon as it is ready rather than at the next tick
+                deadline = time.monotonic()
+
+    async def renew_token(self):
+        """Renew the access token shortly before it expires"""
+        display = self.display
+        while True:
+            token = display.access_token
+            due = renewal_due_at(token) if token else time.time()
+            if due is None:
+                logging.info("Access token has no expiry, background renewal stopped")
+                return
+            await asyncio.sleep(max(0, due - time.time()))
+            async with self.login_lock:
+                # Renewed in the meantime (after a 401, or by another process sharing the token cache)
+                if display.tokens.reload():
+                    continue
+                logging.info("Access token close to expiry, renewing in the background...")
+                renewed = await self.login()
+            if not renewed:
+                logging.warning(f"Background token renewal failed, retrying in {TOKEN_RETRY_INTERVAL}s")
+                await asyncio.sleep(TOKEN_RETRY_INTERVAL)
+
+    async def _listen(self, url):
+        """Hold one event stream connection; returns the delay before reconnecting"""
+        await self.ensure_token()
+        headers = {'Authorization': f'Bearer {self.display.access_token}', 'Accept': 'text/event-stream'}
+        async with self.runtime.http.get(url, headers=headers, timeout=EVENTS_TIMEOUT) as response:
+            if response.status in (404, 405, 501):
+                logging.info(f"No event stream at {url} ({response.status}), using interval polling")
+                return PUSH_UNAVAILABLE_RETRY_INTERVAL
+            if response.status == 401:
+                logging.warning("Event stream rejected the access token")
+                async with self.login_lock:
+                    await self.login()
+                return PUSH_RETRY_INTERVAL
+            response.raise_for_status()
+
+            self.push_connected = True
+            logging.info(f"Connected to event stream {url}")
+            splitter = SseLineSplitter()
+            parser = SseParser()
+            async for chunk in response.content.iter_any():
+                for line in splitter.feed(chunk):
+                    completed = parser.feed(line)
+                    if completed is not None and completed[0] == 'update':
+                        logging.info(f"Server signalled new content ({completed[1] or 'no details'})")
+                        self.changed.set()
+        return PUSH_RETRY_INTERVAL
+
+    async def listen_events(self):
+        """Wake the update loop on server-pushed changes; polling stays as the fallback"""
+        url = f'{self.runtime.api_url}/display/events'
+        while True:
+            try:
+                delay = await self._listen(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Event stream disconnected: {e}")
+                delay = PUSH_RETRY_INTERVAL
+            except Exception as e:
+                logging.error(f"Event stream failed: {e}")
+                delay = PUSH_RETRY_INTERVAL
+            if self.push_connected:
+                # Content may change while we are disconnected, poll once to be safe
+                self.push_connected = False
+                self.changed.set()
+            await asyncio.sleep(delay)
+
+    def describe(self):
+        return f"panel '{self.display.name}'" if self.display.name else "the panel"
+
+
+class AsyncRuntime:
+    """One event loop serving every panel of the process"""
+
+    def __init__(self, displays, api_url, update, prefetch_lead=0, push=False):
+        """
+        Args:
+            displays: QuietDashDisplay instances, not initialized yet
+            api_url: API base URL
+            update: Blocking callable (display, frame) showing a frame or the fallback (update_panel)
+            prefetch_lead: Seconds to fetch and convert each frame ahead of its refresh
+            push: Listen to the server's event stream
+        """
+        self.api_url = api_url
+        self.update = update
+        self.prefetch_lead = prefetch_lead
+        self.push = push
+        self.displays = list(displays)
+        # AsyncPanel instances, created by run() inside the event loop
+        self.panels = []
+        self.http = None
+        # Panel calls are serialized on one thread: SPI is blocking and panels may share the bus
+        self.panel_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='panel-io')
+
+    async def start_panel(self, panel):
+        """Initialize a panel and show its last frame while logging in"""
+        display = panel.display
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(self.panel_io, display.init_display):
+            return False
+        # The restore is a full refresh of several seconds; the login runs meanwhile
+        restore = loop.run_in_executor(self.panel_io, display.restore_last_frame)
+        if not await panel.ensure_token():
+            logging.warning("Could not authenticate yet, will keep retrying in the background")
+        await restore
+        return True
+
+    async def watchdog(self, interval):
+        """Ping the systemd watchdog; pings stop if the event loop ever gets stuck"""
+        while True:
+            sd_notify('WATCHDOG=1')
+            await asyncio.sleep(interval)
+
+    def create_panels(self):
+        """
+        Wrap every display in an AsyncPanel
+
+        Called from the running loop: before Python 3.10, locks and events are bound to the loop
+        that is current when they are created, and asyncio.run() starts a new one.
+        """
+        # Panels logging in with the same account share one login (see TokenManager)
+        login_locks = {}
+        self.panels = [
+            AsyncPanel(self, display, login_locks.setdefault(id(display.tokens), asyncio.Lock()))
+            for display in self.displays
+        ]
+
+    async def run(self):
+        """Start all panels, then run their activities until one of them fails"""
+        self.create_panels()
+        connector = aiohttp.TCPConnector(limit=max(10, 2 * len(self.panels)))
+        async with aiohttp.ClientSession(connector=connector) as http:
+            self.http = http
+            started = await asyncio.gather(*(self.start_panel(panel) for panel in self.panels))
+            running = [panel for panel, ok in zip(self.panels, started) if ok]
+            if not running:
+                logging.error("Failed to initialize display, exiting...")
+                return 1
+            if len(running) < len(self.panels):
+                failed = [panel.describe() for panel, ok in zip(self.panels, started) if not ok]
+                logging.error(f"Failed to initialize {', '.join(failed)}, continuing without them")
+
+            activities = []
+            renewing = set()
+            for panel in running:
+                activities.append(panel.update_loop())
+                # One renewal task per account
+                if id(panel.display.tokens) not in renewing:
+                    renewing.add(id(panel.display.tokens))
+                    activities.append(panel.renew_token())
+                if self.push:
+                    activities.append(panel.listen_events())
+            watchdog_usec = os.getenv('WATCHDOG_USEC')
+            if watchdog_usec and watchdog_usec.isdigit():
+                activities.append(self.watchdog(int(watchdog_usec) / 1e6 / 2))
+            sd_notify('READY=1')
+            logging.info(f"asyncio runtime serving {len(running)} panel(s)")
+            await asyncio.gather(*activities)
+        return 0
+
+
+def run_async(displays, **options):
+    """
+    Run the display client on the asyncio runtime (blocks)
+
+    Args:
+        displays: QuietDashDisplay instances
+        options: AsyncRuntime keyword arguments
+
+    Returns:
+        Process exit code
+    """
+    runtime = AsyncRuntime(displays, **options)
+    try:
+        return asyncio.run(runtime.run())
+    finally:
+        runtime.panel_io.shutdown(wait=True)
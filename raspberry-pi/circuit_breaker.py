@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+API failure handling for the QuietDash.io display client
+Retries failed fetches with exponential backoff and jitter, and stops calling an API that keeps
+failing (circuit breaker) until a single probe request succeeds again.
+"""
+
+import os
+import time
+import random
+import logging
+
+# Delay before the first retry after a failed fetch, doubled for every further failure
+RETRY_BASE_DELAY = int(os.getenv('QUIETDASH_RETRY_BASE_DELAY', '30'))
+
+# Upper bound of the retry delay, also how long the circuit stays open at most
+RETRY_MAX_DELAY = int(os.getenv('QUIETDASH_RETRY_MAX_DELAY', '1800'))
+
+# Consecutive failures after which the API is considered down
+BREAKER_THRESHOLD = int(os.getenv('QUIETDASH_BREAKER_THRESHOLD', '3'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def backoff_delay(failures, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY, rng=random):
+    """
+    Exponential backoff with jitter
+
+    Half of the delay is fixed and half is random ("equal jitter"), so many displays that
+    lost the API at the same moment don't all come back at the same second.
+
+    Args:
+        failures: Consecutive failures so far (1 for the first retry)
+
+    Returns:
+        Delay in seconds
+    """
+    delay = min(cap, base * 2 ** max(0, failures - 1))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Tracks API health and decides when the next request may be sent"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, rng=random):
+        self.threshold = max(1, threshold)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = None
+
+    def allow_request(self, now=None):
+        """
+        Return True if a request may be sent now
+
+        Once the open period is over, a single probe request is let through (half-open).
+        """
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            if now < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+            logging.info("Probing the API after an outage")
+        return True
+
+    def record_success(self):
+        """The API answered; close the circuit and forget past failures"""
+        if self.state != CLOSED:
+            logging.info(f"API reachable again after {self.failures} failed attempts")
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = None
+
+    def record_failure(self, now=None):
+        """The API could not be reached or answered with an error; schedule the next attempt"""
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        delay = backoff_delay(self.failures, self.base_delay, self.max_delay, self.rng)
+        self.retry_at = now + delay
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            logging.warning(f"API unavailable after {self.failures} attempts, pausing requests for {delay:.0f}s")
+            self.state = OPEN
+        else:
+            logging.info(f"Fetch failed ({self.failures} in a row), retrying in {delay:.0f}s")
+
+    def time_until_retry(self, now=None):
+        """
+        Seconds until the next attempt after a failure
+
+        Returns:
+            None while the API is healthy (normal polling applies)
+        """
+        if self.retry_at is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0, self.retry_at - now)
@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+1-bit conversion for the Waveshare 7.5" e-Paper
+Selectable dithering algorithms, vectorized with NumPy where PIL has no native implementation.
+Charts and text look best (and convert fastest) with plain threshold or ordered dithering;
+error diffusion only pays off for photos and smooth gradients.
+
+Benchmark time and output quality on 800x480 frames:
+    python3 dithering.py [image ...]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+FLOYD_STEINBERG = 'floyd-steinberg'
+ATKINSON = 'atkinson'
+BAYER = 'bayer'
+BLUE_NOISE = 'blue-noise'
+THRESHOLD = 'threshold'
+
+ALGORITHMS = (FLOYD_STEINBERG, ATKINSON, BAYER, BLUE_NOISE, THRESHOLD)
+
+# Algorithm used by the QuietDash display client (Floyd-Steinberg matches the historical output)
+DITHER_ALGORITHM = os.getenv('QUIETDASH_DITHER', FLOYD_STEINBERG)
+
+# Side of the tiled threshold maps
+BAYER_SIZE = 8
+BLUE_NOISE_SIZE = 64
+
+_threshold_maps = {}
+
+
+def bayer_matrix(size=BAYER_SIZE):
+    """
+    Build the recursive Bayer index matrix
+
+    Args:
+        size: Power of two side length
+
+    Returns:
+        size x size int array holding every rank 0..size*size-1 once
+    """
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1],
+        ])
+    return matrix
+
+
+def blue_noise_matrix(size=BLUE_NOISE_SIZE, sigma=1.5, seed=0):
+    """
+    Build a blue-noise rank matrix with the void-and-cluster method (Ulichney)
+
+    Deterministic for a given seed. Points are ranked by repeatedly removing the tightest
+    cluster of the initial pattern, then filling the largest void until the tile is full;
+    energies are updated incrementally with a toroidal Gaussian kernel.
+
+    Returns:
+        size x size int array holding every rank 0..size*size-1 once
+    """
+    count = size * size
+    distance = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(distance[:, None] ** 2 + distance[None, :] ** 2) / (2 * sigma ** 2))
+
+    def splat(energy, index, sign):
+        y, x = divmod(int(index), size)
+        energy += sign * np.roll(kernel, (y, x), axis=(0, 1))
+
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros((size, size), dtype=bool)
+    pattern.flat[rng.choice(count, count // 10, replace=False)] = True
+    energy = np.real(np.fft.ifft2(np.fft.fft2(pattern) * np.fft.fft2(kernel)))
+
+    # Relax the random seed pattern until the tightest cluster is also the largest void
+    while True:
+        cluster = np.argmax(np.where(pattern, energy, -np.inf))
+        pattern.flat[cluster] = False
+        splat(energy, cluster, -1)
+        void = np.argmin(np.where(pattern, np.inf, energy))
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(count, dtype=np.int32)
+    initial = pattern.copy()
+    initial_energy = energy.copy()
+
+    # Ranks below the seed pattern: strip clusters one by one
+    for rank in range(int(pattern.sum()) - 1, -1, -1):
+        cluster = np.argmax(np.where(pattern, energy, -np.inf))
+        pattern.flat[cluster] = False
+        splat(energy, cluster, -1)
+        ranks[cluster] = rank
+
+    # Ranks above it: fill the largest remaining void
+    pattern, energy = initial, initial_energy
+    for rank in range(int(pattern.sum()), count):
+        void = np.argmin(np.where(pattern, np.inf, energy))
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        ranks[void] = rank
+
+    return ranks.reshape(size, size)
+
+
+def _threshold_map(algorithm, width, height):
+    """Threshold map tiled to the frame size, built once per algorithm and size"""
+    key = (algorithm, width, height)
+    if key not in _threshold_maps:
+        ranks = bayer_matrix() if algorithm == BAYER else blue_noise_matrix()
+        levels = ranks.size
+        # Centre each threshold inside its band of gray values
+        tile = ((ranks + 0.5) * 256 / levels).astype(np.float32)
+        reps = (-(-height // tile.shape[0]), -(-width // tile.shape[1]))
+        _threshold_maps[key] = np.tile(tile, reps)[:height, :width]
+    return _threshold_maps[key]
+
+
+def _atkinson(pixels):
+    """
+    Atkinson error diffusion, vectorized along wavefronts
+
+    Each pixel pushes 1/8 of its error to (x+1, y), (x+2, y), (x-1, y+1), (x, y+1),
+    (x+1, y+1) and (x, y+2) (the remaining 2/8 are dropped). Every pixel on the line
+    2*y + x = t only depends on lines before t, so a whole line is processed per step.
+    """
+    height, width = pixels.shape
+    # Padding: one column left, two right, two rows below
+    stride = width + 3
+    work = np.zeros((height + 2, stride), dtype=np.float32)
+    work[:height, 1:width + 1] = pixels
+    flat = work.reshape(-1)
+    out = np.zeros(height * width, dtype=bool)
+    targets = (1, 2, stride - 1, stride, stride + 1, 2 * stride)
+
+    rows = np.arange(height)
+    for t in range(width + 2 * (height - 1)):
+        first = max(0, (t - width + 2) // 2)
+        last = min(height - 1, t // 2)
+        ys = rows[first:last + 1]
+        xs = t - 2 * ys
+        index = ys * stride + xs + 1
+        values = flat[index]
+        white = values >= 128
+        out[ys * width + xs] = white
+        error = (values - np.where(white, 255, 0)) / 8
+        for offset in targets:
+            flat[index + offset] += error
+    return out.reshape(height, width)
+
+
+def dither(image, algorithm=DITHER_ALGORITHM):
+    """
+    Convert an image to 1-bit for the e-Paper
+
+    Args:
+        image: PIL Image in any mode (converted to grayscale first)
+        algorithm: One of ALGORITHMS
+
+    Returns:
+        PIL Image in mode '1' (white = set bits, as epd.getbuffer expects)
+
+    Raises:
+        ValueError for an unknown algorithm
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown dithering algorithm '{algorithm}', expected one of {', '.join(ALGORITHMS)}")
+    if image.mode == '1':
+        return image
+    if image.mode != 'L':
+        image = image.convert('L')
+
+    if algorithm == FLOYD_STEINBERG:
+        return image.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+    if algorithm == THRESHOLD:
+        return image.convert('1', dither=Image.Dither.NONE)
+
+    pixels = np.asarray(image, dtype=np.float32)
+    if algorithm == ATKINSON:
+        white = _atkinson(pixels)
+    else:
+        white = pixels >= _threshold_map(algorithm, image.width, image.height)
+    return Image.fromarray(white)
+
+
+def quality(original, dithered, radius=2):
+    """
+    Perceptual quality of a dithered frame
+
+    Both images are blurred (a rough model of viewing distance) before comparing them.
+
+    Returns:
+        PSNR in dB; higher is closer to the original
+    """
+    reference = np.asarray(original.convert('L').filter(ImageFilter.GaussianBlur(radius)), dtype=np.float32)
+    result = np.asarray(dithered.convert('L').filter(ImageFilter.GaussianBlur(radius)), dtype=np.float32)
+    mse = float(np.mean((reference - result) ** 2))
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def sample_frames(width=800, height=480):
+    """Synthetic 800x480 test frames: a photo-like gradient and a text/chart dashboard"""
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    photo = 255 * (0.5 + 0.25 * np.sin(8 * x + 3 * y) + 0.25 * np.cos(5 * y * x * 4))
+    photo = Image.fromarray(np.clip(photo, 0, 255).astype(np.uint8))
+
+    chart = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(chart)
+    font = ImageFont.load_default()
+    for row in range(12):
+        draw.text((20, 20 + row * 18), f"Metric {row:02d}   {row * 137 % 1000:>5}   OK", font=font, fill=0)
+    for bar in range(16):
+        top = height - 40 - (bar * 53 % 200)
+        draw.rectangle((400 + bar * 22, top, 415 + bar * 22, height - 40), fill=0 if bar % 2 else 128)
+    draw.line((380, height - 40, width - 20, height - 40), fill=0, width=2)
+    return {'photo': photo, 'chart': chart}
+
+
+def benchmark(frames, repeat=3):
+    """
+    Time every algorithm on every frame
+
+    Args:
+        frames: dict of name -> PIL Image
+        repeat: Runs per measurement (the best one is kept; the first warms the threshold maps)
+
+    Returns:
+        list of (frame name, algorithm, seconds, PSNR) tuples
+    """
+    results = []
+    for name, frame in frames.items():
+        frame = frame.convert('L')
+        for algorithm in ALGORITHMS:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                dithered = dither(frame, algorithm)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append((name, algorithm, best, quality(frame, dithered)))
+    return results
+
+
+def main():
+    """Print the benchmark table for the sample frames or the images given on the command line"""
+    if len(sys.argv) > 1:
+        frames = {os.path.basename(path): Image.open(path).convert('L').resize((800, 480)) for path in sys.argv[1:]}
+    else:
+        frames = sample_frames()
+    print(f"{'frame':<16} {'algorithm':<16} {'time (ms)':>10} {'PSNR (dB)':>10}")
+    for name, algorithm, seconds, psnr in benchmark(frames):
+        print(f"{name:<16} {algorithm:<16} {seconds * 1000:>10.1f} {psnr:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Reusable download buffer for the QuietDash.io display client
+Streams HTTP bodies into one preallocated bytearray instead of allocating fresh copies every cycle
+"""
+
+import os
+import io
+
+# Refuse dashboard payloads larger than this many bytes (default: 2 MiB)
+MAX_IMAGE_BYTES = int(os.getenv('QUIETDASH_MAX_IMAGE_BYTES', str(2 * 1024 * 1024)))
+
+# Initial capacity: a packed 800x480 frame or a typical 1-bit PNG fits without growing
+INITIAL_CAPACITY = 64 * 1024
+
+
+class PayloadTooLarge(ValueError):
+    """Raised when a response body exceeds the configured maximum size"""
+
+
+class DownloadBuffer:
+    """Growable, reusable receive buffer; views it returns are only valid until the next download"""
+
+    def __init__(self, max_size=MAX_IMAGE_BYTES, initial_capacity=INITIAL_CAPACITY):
+        self.max_size = max_size
+        self.buffer = bytearray(min(initial_capacity, max_size))
+        self.size = 0
+
+    def _reserve(self, capacity):
+        """Grow the buffer to at least capacity bytes, keeping what was received so far"""
+        if capacity > self.max_size:
+            raise PayloadTooLarge(f"Payload exceeds {self.max_size} bytes")
+        if capacity <= len(self.buffer):
+            return
+        new_capacity = min(max(capacity, len(self.buffer) * 2), self.max_size)
+        grown = bytearray(new_capacity)
+        grown[:self.size] = memoryview(self.buffer)[:self.size]
+        self.buffer = grown
+
+    def start(self, content_length=None):
+        """
+        Begin a new download
+
+        Args:
+            content_length: Announced body size, if known; checked against the maximum up front
+        """
+        self.size = 0
+        if content_length is not None:
+            self._reserve(content_length)
+
+    def append(self, chunk):
+        """Copy a received chunk into the buffer (for clients that only hand out chunks)"""
+        end = self.size + len(chunk)
+        self._reserve(end)
+        self.buffer[self.size:end] = chunk
+        self.size = end
+
+    def read_from(self, readinto):
+        """
+        Fill the buffer from a readinto-style callable until it reports end of stream
+
+        Args:
+            readinto: Callable taking a writable memoryview and returning the number of bytes read
+        """
+        while True:
+            if self.size == len(self.buffer):
+                self._reserve(self.size + 1)
+            count = readinto(memoryview(self.buffer)[self.size:])
+            if not count:
+                return
+            self.size += count
+
+    def read_response(self, response):
+        """
+        Stream a requests response opened with stream=True into the buffer
+
+        Returns:
+            memoryview of the body (content-decoded)
+        """
+        length = response.headers.get('Content-Length')
+        # A compressed body's length says nothing about the decoded size
+        if response.headers.get('Content-Encoding') not in (None, 'identity'):
+            length = None
+        self.start(int(length) if length and length.isdigit() else None)
+        response.raw.decode_content = True
+        self.read_from(response.raw.readinto)
+        return self.view()
+
+    def view(self):
+        """memoryview of the bytes received by the current download"""
+        return memoryview(self.buffer)[:self.size]
+
+
+class MemoryReader(io.RawIOBase):
+    """Read-only, seekable file object over a memoryview, so decoders can read it without a copy"""
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        count = min(len(b), len(self.view) - self.position)
+        if count <= 0:
+            return 0
+        b[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = len(self.view) + offset
+        self.position = max(0, self.position)
+        return self.position
+
+    def tell(self):
+        return self.position
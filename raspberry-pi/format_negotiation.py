@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Image format negotiation for the QuietDash.io display client
+The client lists every representation it can display in its Accept header, with the one it
+currently prefers first, and advertises gzip/deflate content coding. Each format's transferred
+bytes and on-device decode cost are measured, and the cheapest one is preferred from then on.
+Measuring another format is a forced full download (validators are per representation, so it
+cannot be answered with a 304), so probes are rare: none once packed frames are served, and at
+most one per content change otherwise.
+
+Representations (media ranges sent in Accept):
+    packed       application/vnd.quietdash.frame   pre-packed 1-bit frame (see packed_frame.py)
+    png-1bit     image/png; depth=1                 1-bit grayscale PNG, no dithering needed
+    png-palette  image/png; depth=4                 16-level palette PNG, dithered on the device
+    png          image/png                          whatever PNG the server renders
+"""
+
+import os
+import logging
+
+from packed_frame import DELTA_CONTENT_TYPE, FRAME_CONTENT_TYPE
+
+PACKED = 'packed'
+PNG_1BIT = 'png-1bit'
+PNG_PALETTE = 'png-palette'
+PNG = 'png'
+
+# Media range announced for each representation, in default preference order
+MEDIA_RANGES = {
+    PACKED: FRAME_CONTENT_TYPE,
+    PNG_1BIT: 'image/png; depth=1',
+    PNG_PALETTE: 'image/png; depth=4',
+    PNG: 'image/png',
+}
+
+# Content codings the client can decode (urllib3 inflates them while the body is streamed)
+CONTENT_ENCODINGS = 'gzip, deflate'
+
+# Milliseconds of device decode time one transferred kilobyte is worth; raise it on metered links
+KB_COST_MS = float(os.getenv('QUIETDASH_KB_COST_MS', '1'))
+
+# Frames measured per format before its cost is known
+FORMAT_SAMPLES = 1
+
+# Re-measure a format whose last sample is this many frames old (0 = never); content and server change
+REPROBE_AFTER = int(os.getenv('QUIETDASH_FORMAT_REPROBE', '0'))
+
+# Weight of a new sample in the moving averages
+SMOOTHING = 0.3
+
+
+def response_format(content_type, image_mode=None):
+    """
+    Representation of a received image
+
+    Args:
+        content_type: Content-Type of the response, without parameters
+        image_mode: PIL mode of the decoded PNG ('1', 'P', 'L', ...)
+    """
+    # A tile delta is a cheaper way of transferring a packed frame
+    if content_type in (FRAME_CONTENT_TYPE, DELTA_CONTENT_TYPE):
+        return PACKED
+    if image_mode == '1':
+        return PNG_1BIT
+    if image_mode == 'P':
+        return PNG_PALETTE
+    return PNG
+
+
+class FormatStats:
+    """Moving averages of transferred bytes and decode time for one representation"""
+
+    def __init__(self):
+        self.samples = 0
+        self.wire_bytes = 0.0
+        self.decode_seconds = 0.0
+        # Frame counter value at the last sample (or failed attempt)
+        self.last_sample = None
+        # The server answered a request preferring this format with another one
+        self.unsupported = False
+
+    def add(self, wire_bytes, decode_seconds, frame):
+        if self.samples == 0:
+            self.wire_bytes, self.decode_seconds = float(wire_bytes), decode_seconds
+        else:
+            self.wire_bytes += SMOOTHING * (wire_bytes - self.wire_bytes)
+            self.decode_seconds += SMOOTHING * (decode_seconds - self.decode_seconds)
+        self.samples += 1
+        self.last_sample = frame
+        self.unsupported = False
+
+
+class FormatNegotiator:
+    """Picks the representation to ask for from measured transfer and decode costs"""
+
+    def __init__(self, formats, kb_cost_ms=KB_COST_MS):
+        """
+        Args:
+            formats: Representations the client accepts, in default preference order
+            kb_cost_ms: Milliseconds of decode time one transferred kilobyte is worth
+        """
+        self.formats = list(formats)
+        self.kb_cost_ms = kb_cost_ms
+        self.stats = {fmt: FormatStats() for fmt in self.formats}
+        # Frames received so far
+        self.frames = 0
+        self.requested = self.formats[0]
+        # The last request asked for a format to measure rather than the cheapest one
+        self.probing = False
+        # One probe per content change: set by a frame received in the cheapest format
+        self.probe_allowed = True
+
+    def cost(self, fmt):
+        """Cost of one frame in milliseconds (decode time plus weighted transfer), None if not measured"""
+        stats = self.stats[fmt]
+        if not stats.samples:
+            return None
+        return stats.decode_seconds * 1000 + stats.wire_bytes / 1000 * self.kb_cost_ms
+
+    def _stale(self, fmt):
+        last = self.stats[fmt].last_sample
+        return REPROBE_AFTER > 0 and last is not None and self.frames - last >= REPROBE_AFTER
+
+    def _needs_probe(self, fmt):
+        stats = self.stats[fmt]
+        if stats.unsupported:
+            return self._stale(fmt)
+        return stats.samples < FORMAT_SAMPLES or self._stale(fmt)
+
+    def packed_served(self):
+        """True once the server sends packed frames (or tile deltas of them)"""
+        stats = self.stats.get(PACKED)
+        return stats is not None and stats.samples > 0 and not stats.unsupported
+
+    def cheapest(self):
+        """Cheapest measured representation"""
+        if self.packed_served():
+            # No decoding, and the only format with tile deltas: no PNG variant can beat it
+            return PACKED
+        measured = [fmt for fmt in self.formats if self.cost(fmt) is not None and not self.stats[fmt].unsupported]
+        if not measured:
+            return self.formats[-1]
+        return min(measured, key=self.cost)
+
+    def preferred(self):
+        """Representation the next request asks for first"""
+        if self.packed_served() or not self.probe_allowed:
+            return self.cheapest()
+        # Measure every format first, then re-measure the ones whose numbers are getting old
+        for fmt in self.formats:
+            if self._needs_probe(fmt):
+                return fmt
+        return self.cheapest()
+
+    def accept_header(self):
+        """Accept header listing all representations, the preferred one first"""
+        self.requested = self.preferred()
+        self.probing = self.requested != self.cheapest()
+        others = sorted(
+            (fmt for fmt in self.formats if fmt != self.requested),
+            key=lambda fmt: (self.cost(fmt) is None, self.cost(fmt) or 0),
+        )
+        ranges = [MEDIA_RANGES[self.requested]]
+        for index, fmt in enumerate(others):
+            ranges.append(f'{MEDIA_RANGES[fmt]}; q={0.9 - 0.1 * index:.1f}')
+        return ', '.join(ranges + ['image/*; q=0.1'])
+
+    def record(self, fmt, wire_bytes, decode_seconds):
+        """
+        Record a received frame
+
+        Args:
+            fmt: Representation the server actually sent (see response_format)
+            wire_bytes: Body bytes as transferred, before content decoding
+            decode_seconds: Time from the received body to the panel buffer
+        """
+        self.frames += 1
+        # A probe uses up the current content change; a frame in the cheapest format is a new one
+        self.probe_allowed = not self.probing
+        if fmt not in self.stats:
+            return
+        if fmt != self.requested and self.requested in self.stats:
+            # Not offered by the server: stop asking for it until it is due for a re-check
+            requested = self.stats[self.requested]
+            if not requested.unsupported:
+                logging.info(f"Server does not offer {self.requested} frames, answered with {fmt}")
+            requested.unsupported = True
+            requested.last_sample = self.frames
+        self.stats[fmt].add(wire_bytes, decode_seconds, self.frames)
+
+    def describe(self):
+        """Short human-readable summary of the measured costs"""
+        parts = []
+        for fmt in self.formats:
+            stats = self.stats[fmt]
+            if stats.unsupported:
+                parts.append(f"{fmt}: not offered")
+            elif stats.samples:
+                parts.append(f"{fmt}: {stats.wire_bytes / 1000:.1f} kB, {stats.decode_seconds * 1000:.0f} ms")
+        return ', '.join(parts) or 'nothing measured yet'
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Frame bookkeeping for the Waveshare 7.5" e-Paper
+Remembers which frame is currently on the panel so identical frames are never refreshed twice
+and partial refreshes can be diffed against it, even across service restarts.
+Also keeps the last good dashboard frame so it can be pushed to the panel at boot.
+"""
+
+import os
+import json
+import time
+import logging
+import hashlib
+
+# State lives next to the scripts by default so it survives service restarts
+script_dir = os.path.dirname(os.path.realpath(__file__))
+STATE_DIR = os.getenv('QUIETDASH_STATE_DIR', os.path.join(script_dir, 'state'))
+
+
+def frame_hash(buffer):
+    """
+    Hash a packed display buffer as returned by epd.getbuffer
+
+    Args:
+        buffer: bytes/bytearray/list of packed 1-bit pixels
+
+    Returns:
+        Hex digest identifying the frame
+    """
+    return hashlib.sha256(bytes(buffer)).hexdigest()
+
+
+class FrameStore:
+    """Tracks the last frame actually shown on the panel, persisted on disk"""
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.meta_path = os.path.join(state_dir, 'last_frame.json')
+        self.frame_path = os.path.join(state_dir, 'last_frame.bin')
+        self.last_good_meta_path = os.path.join(state_dir, 'last_good.json')
+        self.last_good_path = os.path.join(state_dir, 'last_good.bin')
+        self.meta = self._load_meta()
+        self._frame = None
+
+    @property
+    def last_hash(self):
+        """Hash of the frame on the panel, or None if unknown"""
+        return self.meta.get('hash')
+
+    def _load_meta(self, path=None):
+        """Read persisted frame metadata, if any"""
+        path = path or self.meta_path
+        try:
+            with open(path, 'r') as f:
+                meta = json.load(f)
+            return meta if isinstance(meta, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read frame metadata from {path}: {e}")
+            return {}
+
+    def _load_frame_file(self, path, expected_hash):
+        """Read a persisted frame, returning None unless it matches expected_hash"""
+        try:
+            with open(path, 'rb') as f:
+                frame = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Could not read frame from {path}: {e}")
+            return None
+        if frame_hash(frame) != expected_hash:
+            logging.warning(f"Frame in {path} does not match its recorded hash, ignoring it")
+            return None
+        return frame
+
+    def _write_atomic(self, path, data, mode='wb'):
+        """Write a state file through a temporary file so a crash never leaves it half-written"""
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not persist panel state to {path}: {e}")
+
+    def is_unchanged(self, buffer):
+        """Return True if buffer is the frame already shown on the panel"""
+        return self.last_hash is not None and frame_hash(buffer) == self.last_hash
+
+    def load_frame(self):
+        """
+        Return the packed frame currently on the panel
+
+        Returns:
+            bytes, or None if unknown or the stored copy does not match the recorded hash
+        """
+        if self._frame is not None or self.last_hash is None:
+            return self._frame
+        self._frame = self._load_frame_file(self.frame_path, self.last_hash)
+        return self._frame
+
+    def record(self, buffer, **meta):
+        """
+        Remember buffer as the frame now shown on the panel
+
+        Args:
+            buffer: Packed frame that was just displayed
+            **meta: Extra JSON-serializable fields to persist alongside the frame
+        """
+        self._frame = bytes(buffer)
+        self.meta = dict(meta, hash=frame_hash(self._frame))
+        self._write_atomic(self.frame_path, self._frame)
+        self._write_atomic(self.meta_path, json.dumps(self.meta), mode='w')
+
+    def forget(self):
+        """Mark the panel content as unknown (e.g. after epd.Clear())"""
+        self._frame = None
+        self.meta = {}
+        self._write_atomic(self.meta_path, json.dumps(self.meta), mode='w')
+
+    def save_last_good(self, buffer, **meta):
+        """
+        Keep buffer as the last good dashboard frame, to be restored at the next boot
+
+        Args:
+            buffer: Packed frame that was successfully displayed
+            **meta: JSON-serializable metadata (dimensions, HTTP validators, ...)
+        """
+        frame = bytes(buffer)
+        meta = dict(meta, hash=frame_hash(frame), saved_at=time.time())
+        self._write_atomic(self.last_good_path, frame)
+        self._write_atomic(self.last_good_meta_path, json.dumps(meta), mode='w')
+
+    def confirm_last_good(self):
+        """Record that the server still serves the last good frame (metadata rewrite only)"""
+        meta = self._load_meta(self.last_good_meta_path)
+        if not meta.get('hash'):
+            return
+        meta['confirmed_at'] = time.time()
+        self._write_atomic(self.last_good_meta_path, json.dumps(meta), mode='w')
+
+    def load_last_good(self):
+        """
+        Load the last good dashboard frame
+
+        Returns:
+            (bytes, metadata dict), or (None, {}) if there is no usable frame
+        """
+        meta = self._load_meta(self.last_good_meta_path)
+        if not meta.get('hash'):
+            return None, {}
+        frame = self._load_frame_file(self.last_good_path, meta['hash'])
+        if frame is None:
+            return None, {}
+        return frame, meta
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Ghosting-aware full refresh policy for the Waveshare 7.5" e-Paper V2
+Partial refreshes leave a faint ghost of the previous content, and it builds up with every pixel
+that flips in the same spot. Instead of a full refresh after a fixed number of partial updates,
+the panel is split into 16x16 regions and two small counter bitmaps are kept: partial updates that
+touched each region and pixel flips accumulated in it. A full refresh is only needed once some
+region reaches a limit, and is done early, while it is still optional, when a large part of the
+panel changes anyway and the full refresh costs little extra.
+"""
+
+import os
+import base64
+import logging
+
+import numpy as np
+
+# Accumulated pixel flips per pixel of a region (averaged over the region) before it needs a full refresh
+GHOSTING_FLIP_LIMIT = float(os.getenv('QUIETDASH_GHOSTING_FLIP_LIMIT', '6'))
+
+# Region size in pixels (same grid as the partial refresh diff and the frame deltas)
+REGION_SIZE = 16
+
+# Regions past this share of a limit get their full refresh early when the content changes a lot anyway
+EARLY_REFRESH_PRESSURE = 0.5
+
+# Share of the panel that must change for a full refresh to count as "almost free"
+EARLY_REFRESH_AREA = 0.2
+
+# Counters are persisted with this many bits (saturating)
+UPDATE_COUNT_DTYPE = np.uint8
+FLIP_COUNT_DTYPE = np.uint16
+
+# Decisions of GhostingPolicy.plan
+PARTIAL = 'partial'
+FULL_GHOSTING = 'ghosting'
+FULL_EARLY = 'early'
+
+
+def region_flips(previous, current, width, height):
+    """
+    Count the pixels that differ between two packed frames, per region
+
+    Returns:
+        uint32 array of shape (regions down, regions across)
+    """
+    changed = np.bitwise_xor(np.frombuffer(previous, dtype=np.uint8), np.frombuffer(current, dtype=np.uint8))
+    bits = np.unpackbits(changed).reshape(height, width)
+    rows = -(-height // REGION_SIZE)
+    cols = -(-width // REGION_SIZE)
+    padded = np.zeros((rows * REGION_SIZE, cols * REGION_SIZE), dtype=np.uint32)
+    padded[:height, :width] = bits
+    return padded.reshape(rows, REGION_SIZE, cols, REGION_SIZE).sum(axis=(1, 3))
+
+
+class GhostingPolicy:
+    """Per-region partial update and pixel flip counters deciding when a full refresh is due"""
+
+    def __init__(self, width, height, max_updates, flip_limit=GHOSTING_FLIP_LIMIT):
+        """
+        Args:
+            width: Panel width in pixels (multiple of 8)
+            height: Panel height in pixels
+            max_updates: Partial updates a region may get between two full refreshes
+            flip_limit: Accumulated flips per pixel a region may get between two full refreshes
+        """
+        self.width = width
+        self.height = height
+        self.max_updates = max_updates
+        self.flip_limit = flip_limit
+        shape = (-(-height // REGION_SIZE), -(-width // REGION_SIZE))
+        self.updates = np.zeros(shape, dtype=UPDATE_COUNT_DTYPE)
+        self.flips = np.zeros(shape, dtype=FLIP_COUNT_DTYPE)
+        self.max_flips = flip_limit * REGION_SIZE * REGION_SIZE
+
+    def _pressure(self, updates, flips):
+        """Share of the closest limit reached by the worst region (1.0 = full refresh needed)"""
+        update_pressure = updates.max() / self.max_updates if self.max_updates > 0 else 0.0
+        flip_pressure = flips.max() / self.max_flips if self.max_flips > 0 else 0.0
+        return max(float(update_pressure), float(flip_pressure))
+
+    @property
+    def pressure(self):
+        return self._pressure(self.updates, self.flips)
+
+    def plan(self, previous, current):
+        """
+        Decide whether showing current over previous can be a partial refresh
+
+        Returns:
+            (PARTIAL, FULL_GHOSTING or FULL_EARLY, flip counts per region to pass to record_partial)
+        """
+        flips = region_flips(previous, current, self.width, self.height)
+        touched = flips > 0
+        updates = self.updates.astype(np.uint32) + touched
+        accumulated = self.flips.astype(np.uint32) + flips
+        pressure = self._pressure(updates, accumulated)
+        if pressure >= 1.0:
+            row, col = np.unravel_index(
+                np.argmax(np.maximum(updates / max(self.max_updates, 1), accumulated / max(self.max_flips, 1))),
+                updates.shape,
+            )
+            logging.info(f"Region at ({col * REGION_SIZE}, {row * REGION_SIZE}) reached its ghosting limit "
+                         f"({int(updates[row, col])} partial updates, {int(accumulated[row, col])} pixel flips), full refresh")
+            return FULL_GHOSTING, flips
+        changed_area = touched.mean()
+        if pressure >= EARLY_REFRESH_PRESSURE and changed_area >= EARLY_REFRESH_AREA:
+            logging.info(f"{changed_area * 100:.0f}% of the panel changes and ghosting is at {pressure * 100:.0f}% "
+                         f"of its limit, clearing it now with a full refresh")
+            return FULL_EARLY, flips
+        return PARTIAL, flips
+
+    def record_partial(self, flips):
+        """Account for a partial refresh that flipped these pixels (counters saturate)"""
+        touched = flips > 0
+        self.updates = np.minimum(self.updates.astype(np.uint32) + touched, np.iinfo(UPDATE_COUNT_DTYPE).max).astype(UPDATE_COUNT_DTYPE)
+        self.flips = np.minimum(self.flips.astype(np.uint32) + flips, np.iinfo(FLIP_COUNT_DTYPE).max).astype(FLIP_COUNT_DTYPE)
+
+    def record_full(self):
+        """A full refresh clears all ghosting"""
+        self.updates[:] = 0
+        self.flips[:] = 0
+
+    def to_meta(self):
+        """Counters as a JSON-serializable dict, to persist with the frame on the panel"""
+        return {
+            'shape': list(self.updates.shape),
+            'updates': base64.b64encode(self.updates.tobytes()).decode('ascii'),
+            'flips': base64.b64encode(self.flips.astype('<u2').tobytes()).decode('ascii'),
+        }
+
+    def load_meta(self, meta, partial_updates=0):
+        """
+        Restore counters persisted by to_meta
+
+        Args:
+            meta: Dict from to_meta, or None
+            partial_updates: Panel-wide partial update count of state written before this policy
+                existed; every region is assumed to have had that many updates
+        """
+        self.record_full()
+        if not meta:
+            self.updates[:] = min(partial_updates, np.iinfo(UPDATE_COUNT_DTYPE).max)
+            return
+        try:
+            if tuple(meta['shape']) != self.updates.shape:
+                raise ValueError(f"shape {meta['shape']}")
+            self.updates = np.frombuffer(base64.b64decode(meta['updates']), dtype=UPDATE_COUNT_DTYPE).reshape(self.updates.shape).copy()
+            self.flips = np.frombuffer(base64.b64decode(meta['flips']), dtype='<u2').astype(FLIP_COUNT_DTYPE).reshape(self.flips.shape)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Ignoring persisted ghosting counters ({e}), a full refresh will reset them")
+            self.updates[:] = np.iinfo(UPDATE_COUNT_DTYPE).max
@@ -90,7 +90,27 @@ if [ ! -f "$SCRIPT_DIR/quietdash_display.py" ]; then
     exit 1
 fi
 cp "$SCRIPT_DIR/quietdash_display.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/frame_store.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/partial_refresh.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/panel_state.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/ghosting.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/token_manager.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/push_listener.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/packed_frame.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/download_buffer.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/dithering.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/poll_scheduler.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/circuit_breaker.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/panel_config.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/panel_backend.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/panel_rotation.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/panel_writer.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/metrics.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/refresh_clock.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/format_negotiation.py" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/async_runtime.py" "$QUIETDASH_DIR/"
 cp "$SCRIPT_DIR/requirements.txt" "$QUIETDASH_DIR/"
+cp "$SCRIPT_DIR/requirements-async.txt" "$QUIETDASH_DIR/"
 if [ -f "$SCRIPT_DIR/.env.example" ]; then
     cp "$SCRIPT_DIR/.env.example" "$QUIETDASH_DIR/"
 fi
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Latency harness for the QuietDash.io display client
+Runs the real client update loop against an in-process stand-in API (stand_in_server.py) and an
+in-memory panel, then reports how long each dashboard change took to reach the panel.
+
+Client behaviour is configured through the usual QUIETDASH_* environment variables, so every
+client-side optimization can be measured by toggling it between two runs:
+    python3 load_harness.py --duration 600 --change-interval 30 --latency 0.3 --failure-rate 0.05
+    QUIETDASH_PUSH=1 python3 load_harness.py --duration 600 --change-interval 30 --latency 0.3
+
+The panel is a virtual one (panel_backend.py), so the harness runs on any machine without SPI/GPIO.
+"""
+
+import os
+import re
+import math
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+from panel_backend import VirtualEPD
+from stand_in_server import StandInState, create_server
+
+ETAG_VERSION = re.compile(r'"v(\d+)')
+
+
+class HarnessPanel(VirtualEPD):
+    """Virtual panel with the refresh durations given on the command line, never written to disk"""
+
+    full_refresh_time_override = 0.0
+    partial_refresh_time_override = 0.0
+
+    def __init__(self, name=None):
+        super().__init__(name, output_dir='', time_scale=0)
+        self.full_refresh_time = self.fast_refresh_time = self.full_refresh_time_override
+        self.partial_refresh_time = self.partial_refresh_time_override
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def main():
+    """Run the client against the stand-in API for a while and print latency percentiles"""
+    parser = argparse.ArgumentParser(description='End-to-end refresh latency harness for the display client')
+    parser.add_argument('--duration', type=float, default=300, help='Seconds to run the client')
+    parser.add_argument('--change-interval', type=float, default=30, help='Seconds between dashboard changes')
+    parser.add_argument('--token-lifetime', type=int, default=7 * 24 * 3600)
+    parser.add_argument('--no-raw-frames', action='store_true')
+    parser.add_argument('--no-png-variants', action='store_true')
+    parser.add_argument('--no-compression', action='store_true')
+    parser.add_argument('--no-deltas', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-status', type=int, default=503)
+    parser.add_argument('--payload-bytes', type=int, default=0)
+    parser.add_argument('--no-conditional', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--full-refresh-time', type=float, default=0.0,
+                        help='Simulated full panel refresh duration (about 4s on the real panel)')
+    parser.add_argument('--partial-refresh-time', type=float, default=0.0,
+                        help='Simulated partial panel refresh duration')
+    parser.add_argument('--verbose', action='store_true', help='Keep the client and server logs')
+    args = parser.parse_args()
+
+    state = StandInState(
+        args.change_interval, args.token_lifetime, not args.no_raw_frames,
+        latency=args.latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, failure_status=args.failure_status,
+        payload_bytes=args.payload_bytes, conditional=not args.no_conditional, seed=args.seed,
+        png_variants=not args.no_png_variants, compression=not args.no_compression, deltas=not args.no_deltas,
+    )
+    server = create_server(state, port=0)
+    threading.Thread(target=server.serve_forever, name='stand-in-api', daemon=True).start()
+
+    # The client reads its configuration at import time
+    os.environ['QUIETDASH_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ['QUIETDASH_STATE_DIR'] = tempfile.mkdtemp(prefix='quietdash-harness-')
+    import quietdash_display as client
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    HarnessPanel.full_refresh_time_override = args.full_refresh_time
+    HarnessPanel.partial_refresh_time_override = args.partial_refresh_time
+    client.create_panel = lambda device, name=None: HarnessPanel(name)
+
+    display = client.QuietDashDisplay()
+    shown = {}
+    show_api_frame = display.show_api_frame
+
+    def timed_show_api_frame(frame):
+        """Record when each content version first lands on the panel"""
+        result = show_api_frame(frame)
+        if result and frame is not None and frame is not client.NOT_MODIFIED:
+            match = ETAG_VERSION.match(frame.etag or '')
+            if match:
+                shown.setdefault(int(match.group(1)), time.time())
+        return result
+
+    display.show_api_frame = timed_show_api_frame
+
+    started = time.time()
+    if not display.init_display():
+        return 1
+    display.ensure_token()
+    display.start_token_renewal()
+    if client.PUSH_ENABLED:
+        display.start_push_listener()
+    if client.PANEL_WRITER:
+        display.writer = client.PanelWriter(client.show_panel, keep_pending=client.keep_pending_frame)
+        display.writer.start()
+    loop = client.run_pipelined if client.PREFETCH_LEAD > 0 else client.run_sequential
+    threading.Thread(target=loop, args=(display,), name='client-loop', daemon=True).start()
+
+    time.sleep(args.duration)
+    finished = time.time()
+    display.tokens.stop_renewal()
+    if display.push_listener:
+        display.push_listener.stop()
+    if display.writer:
+        display.writer.stop()
+    server.shutdown()
+
+    # Versions published while the client was running, excluding the one live at startup
+    first = int(started // args.change_interval) + 1
+    last = int(finished // args.change_interval)
+    published = range(first, last + 1)
+    latencies = [shown[v] - v * args.change_interval for v in published if v in shown]
+    startup = min(shown.values()) - started if shown else None
+
+    print(f"Ran {finished - started:.0f}s, {len(published)} changes published, {len(latencies)} shown, "
+          f"{len(published) - len(latencies)} missed (superseded or not polled in time)")
+    if startup is not None:
+        print(f"First frame on the panel {startup:.2f}s after start")
+    if latencies:
+        print("Change-to-panel latency (s): " + ", ".join(
+            f"p{int(q * 100)}={percentile(latencies, q):.2f}" for q in (0.5, 0.9, 0.99)
+        ) + f", max={max(latencies):.2f}")
+    print("Requests:")
+    for (path, status), count in sorted(state.stats.items()):
+        print(f"  {path:<16} {status}  x{count}")
+    print("Response bytes:")
+    for path, size in sorted(state.bytes_sent.items()):
+        print(f"  {path:<16} {size}")
+    print("Images served:")
+    for (representation, coding), count in sorted(state.served.items()):
+        print(f"  {representation:<12} {coding:<9} x{count}")
+    print(f"Client format costs: {display.formats.describe()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
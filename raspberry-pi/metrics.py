@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Per-stage timing metrics for the QuietDash.io display client
+Stage timings go into histograms and events into counters, exported in the Prometheus text
+format to a textfile (node_exporter textfile collector) and/or a small local HTTP endpoint.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus textfile rewritten after every update cycle (empty = disabled)
+METRICS_FILE = os.getenv('QUIETDASH_METRICS_FILE', '')
+
+# Serve /metrics on 127.0.0.1 on this port (0 = disabled)
+METRICS_PORT = int(os.getenv('QUIETDASH_METRICS_PORT', '0'))
+
+# Histogram bucket upper bounds in seconds: from getbuffer (ms) to full panel refreshes (s)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_PREFIX = 'quietdash'
+
+# Help text of the exported metric families
+HELP = {
+    'stage_seconds': 'Time spent per stage of the update cycle',
+    'http_bytes_total': 'Image body bytes transferred from the API (before content decoding), by format and encoding',
+    'not_modified_total': 'Image requests answered with 304 Not Modified',
+    'refreshes_total': 'Frames pushed to the panel, by refresh kind (skipped = identical frame)',
+    'fetch_failures_total': 'Image fetches that failed',
+    'full_refresh_reasons_total': 'Full refreshes chosen instead of a partial one, by reason (ghosting limit, early, changed area, controller just woke up)',
+    'panel_transitions_total': 'Panel controller power/mode transitions (init and sleep calls), by from and to state',
+    'frames_superseded_total': 'Frames replaced by a newer one before the panel was free to show them',
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels)) + '}'
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe registry of stage histograms and counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, frozenset of label items) -> Histogram / float
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds, **labels):
+        """Record the duration of one stage"""
+        key = ('stage_seconds', frozenset(dict(labels, stage=stage).items()))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Time the enclosed block as stage (monotonic clock)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter (name without the quietdash_ prefix, e.g. 'not_modified_total')"""
+        key = (name, frozenset(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def for_panel(self, panel):
+        """View of this registry that labels everything with the given panel name"""
+        return PanelMetrics(self, panel)
+
+    def render(self):
+        """Prometheus text exposition of all metrics"""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: (item[0][0], sorted(item[0][1])))
+            counters = sorted(self.counters.items(), key=lambda item: (item[0][0], sorted(item[0][1])))
+
+        family = None
+        for (name, labels), histogram in histograms:
+            full_name = f'{METRIC_PREFIX}_{name}'
+            if name != family:
+                family = name
+                lines.append(f'# HELP {full_name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {full_name} histogram')
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{full_name}_bucket{_format_labels(labels | {("le", str(bound))})} {count}')
+            lines.append(f'{full_name}_bucket{_format_labels(labels | {("le", "+Inf")})} {histogram.count}')
+            lines.append(f'{full_name}_sum{_format_labels(labels)} {histogram.sum:.6f}')
+            lines.append(f'{full_name}_count{_format_labels(labels)} {histogram.count}')
+
+        for (name, labels), value in counters:
+            full_name = f'{METRIC_PREFIX}_{name}'
+            if name != family:
+                family = name
+                lines.append(f'# HELP {full_name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {full_name} counter')
+            lines.append(f'{full_name}{_format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path=METRICS_FILE):
+        """Atomically rewrite the Prometheus textfile, if one is configured"""
+        if not path:
+            return
+        try:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics to {path}: {e}")
+
+    def serve(self, port=METRICS_PORT, host='127.0.0.1'):
+        """
+        Serve /metrics over HTTP on a daemon thread
+
+        Returns:
+            The ThreadingHTTPServer, or None if the port is 0 or cannot be bound
+        """
+        if not port:
+            return None
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logging.warning(f"Could not serve metrics on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+
+class PanelMetrics:
+    """Metrics bound to one panel (adds a panel label in multi-panel mode)"""
+
+    def __init__(self, registry, panel=None):
+        self.registry = registry
+        self.labels = {'panel': panel} if panel else {}
+
+    def observe(self, stage, seconds, **labels):
+        self.registry.observe(stage, seconds, **self.labels, **labels)
+
+    def timer(self, stage, **labels):
+        return self.registry.timer(stage, **self.labels, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        self.registry.inc(name, amount, **self.labels, **labels)
+
+
+# Process-wide registry shared by all panels
+METRICS = Metrics()
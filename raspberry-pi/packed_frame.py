@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Raw packed 1-bit frame format for the Waveshare 7.5" e-Paper
+A pre-packed frame can go straight to epd.display without decoding, resizing or dithering.
+
+Wire format (big-endian), served as FRAME_CONTENT_TYPE:
+    magic     4 bytes  b'QDF1'
+    width     uint16   pixels, multiple of 8
+    height    uint16   pixels
+    rotation  uint16   clockwise degrees the client must still apply (0 or 180)
+    flags     uint16   FLAG_BLACK_IS_ONE if set bits are black (panel order), else set bits are white (PIL order)
+    payload   width * height / 8 bytes, rows top to bottom, MSB = leftmost pixel
+
+Tile delta format (big-endian), served as DELTA_CONTENT_TYPE with status 226 IM Used to clients
+that sent "A-IM: qd-tiles" and the hash of the frame payload they hold in X-QuietDash-Base-Frame:
+    magic        4 bytes   b'QDD1'
+    width        uint16    pixels
+    height       uint16    pixels
+    rotation     uint16    as in the frame format
+    flags        uint16    as in the frame format
+    tile width   uint16    pixels, multiple of 8 dividing width
+    tile height  uint16    rows, dividing height
+    tile count   uint32
+    base hash    32 bytes  SHA-256 of the payload the tiles apply to
+    result hash  32 bytes  SHA-256 of the payload once patched
+    tiles        tile count * (uint16 tile index, row-major, + tile width / 8 * tile height bytes)
+"""
+
+import struct
+import hashlib
+from collections import namedtuple
+
+FRAME_CONTENT_TYPE = 'application/vnd.quietdash.frame'
+FRAME_MAGIC = b'QDF1'
+FRAME_HEADER = struct.Struct('>4sHHHH')
+FLAG_BLACK_IS_ONE = 0x0001
+
+# Header fields plus a zero-copy view of the packed pixels
+PackedFrame = namedtuple('PackedFrame', ['width', 'height', 'rotation', 'flags', 'payload'])
+
+DELTA_CONTENT_TYPE = 'application/vnd.quietdash.delta'
+DELTA_MAGIC = b'QDD1'
+DELTA_HEADER = struct.Struct('>4sHHHHHHI32s32s')
+DELTA_TILE_INDEX = struct.Struct('>H')
+
+# Instance manipulation name announced in A-IM / IM headers (RFC 3229)
+DELTA_IM = 'qd-tiles'
+
+# Default delta tile size, the same as the partial refresh diff tiles
+DELTA_TILE_WIDTH = 16
+DELTA_TILE_HEIGHT = 16
+
+# Header fields and (tile index, memoryview of the packed tile rows) pairs
+TileDelta = namedtuple('TileDelta', [
+    'width', 'height', 'rotation', 'flags', 'tile_width', 'tile_height', 'base_hash', 'result_hash', 'tiles',
+])
+
+# Lookup tables for bytes.translate
+INVERT_TABLE = bytes(b ^ 0xFF for b in range(256))
+BIT_REVERSE_TABLE = bytes(int(f'{b:08b}'[::-1], 2) for b in range(256))
+
+
+def parse_frame(data):
+    """
+    Parse a packed frame received from the API
+
+    Args:
+        data: bytes-like object holding header and payload
+
+    Returns:
+        PackedFrame whose payload is a memoryview into data
+
+    Raises:
+        ValueError if the header or payload size is invalid
+    """
+    view = memoryview(data)
+    if len(view) < FRAME_HEADER.size:
+        raise ValueError(f"Packed frame too short: {len(view)} bytes")
+    magic, width, height, rotation, flags = FRAME_HEADER.unpack_from(view)
+    if magic != FRAME_MAGIC:
+        raise ValueError(f"Not a packed frame (magic {magic!r})")
+    if width % 8:
+        raise ValueError(f"Packed frame width {width} is not a multiple of 8")
+    if rotation not in (0, 180):
+        raise ValueError(f"Unsupported packed frame rotation {rotation}")
+    payload = view[FRAME_HEADER.size:]
+    expected = width * height // 8
+    if len(payload) != expected:
+        raise ValueError(f"Packed frame payload is {len(payload)} bytes, expected {expected}")
+    return PackedFrame(width, height, rotation, flags, payload)
+
+
+def encode_frame(buffer, width, height, rotation=0, flags=0):
+    """Serialize a packed buffer in the wire format (used by the stand-in server)"""
+    return FRAME_HEADER.pack(FRAME_MAGIC, width, height, rotation, flags) + bytes(buffer)
+
+
+def rotate_180(buffer):
+    """Rotate a packed 1-bit frame by 180 degrees: reverse byte order, then the bits of each byte"""
+    return bytes(buffer)[::-1].translate(BIT_REVERSE_TABLE)
+
+
+def payload_hash(payload):
+    """SHA-256 digest of a frame payload, identifying it as a delta base"""
+    return hashlib.sha256(payload).digest()
+
+
+def encode_delta(base, current, width, height, rotation=0, flags=0,
+                 tile_width=DELTA_TILE_WIDTH, tile_height=DELTA_TILE_HEIGHT):
+    """
+    Serialize the tiles of current that differ from base (used by the stand-in server)
+
+    Args:
+        base: Payload the client holds
+        current: Payload to bring it to
+        width: Frame width in pixels
+        height: Frame height in pixels
+
+    Returns:
+        Delta in the wire format
+    """
+    stride = width // 8
+    tile_bytes = tile_width // 8
+    tile_cols = width // tile_width
+    tiles = []
+    for tile_row in range(height // tile_height):
+        rows = range(tile_row * tile_height, (tile_row + 1) * tile_height)
+        changed_rows = [y for y in rows if base[y * stride:(y + 1) * stride] != current[y * stride:(y + 1) * stride]]
+        if not changed_rows:
+            continue
+        for col in range(tile_cols):
+            offset = col * tile_bytes
+            if all(base[y * stride + offset:y * stride + offset + tile_bytes] ==
+                   current[y * stride + offset:y * stride + offset + tile_bytes] for y in changed_rows):
+                continue
+            tiles.append(DELTA_TILE_INDEX.pack(tile_row * tile_cols + col) + b''.join(
+                current[y * stride + offset:y * stride + offset + tile_bytes] for y in rows
+            ))
+    header = DELTA_HEADER.pack(
+        DELTA_MAGIC, width, height, rotation, flags, tile_width, tile_height, len(tiles),
+        payload_hash(base), payload_hash(current),
+    )
+    return header + b''.join(tiles)
+
+
+def parse_delta(data):
+    """
+    Parse a tile delta received from the API
+
+    Returns:
+        TileDelta whose tiles are memoryviews into data
+
+    Raises:
+        ValueError if the header or the tile list is invalid
+    """
+    view = memoryview(data)
+    if len(view) < DELTA_HEADER.size:
+        raise ValueError(f"Tile delta too short: {len(view)} bytes")
+    (magic, width, height, rotation, flags, tile_width, tile_height, count,
+     base_hash, result_hash) = DELTA_HEADER.unpack_from(view)
+    if magic != DELTA_MAGIC:
+        raise ValueError(f"Not a tile delta (magic {magic!r})")
+    if not tile_width or not tile_height or tile_width % 8 or width % tile_width or height % tile_height:
+        raise ValueError(f"Tile size {tile_width}x{tile_height} does not divide the {width}x{height} frame")
+    if rotation not in (0, 180):
+        raise ValueError(f"Unsupported tile delta rotation {rotation}")
+    tile_size = tile_width // 8 * tile_height
+    entry_size = DELTA_TILE_INDEX.size + tile_size
+    body = view[DELTA_HEADER.size:]
+    if len(body) != count * entry_size:
+        raise ValueError(f"Tile delta body is {len(body)} bytes, expected {count * entry_size}")
+    tile_count = (width // tile_width) * (height // tile_height)
+    tiles = []
+    for offset in range(0, len(body), entry_size):
+        (index,) = DELTA_TILE_INDEX.unpack_from(body, offset)
+        if index >= tile_count:
+            raise ValueError(f"Tile index {index} out of range")
+        tiles.append((index, body[offset + DELTA_TILE_INDEX.size:offset + entry_size]))
+    return TileDelta(width, height, rotation, flags, tile_width, tile_height, base_hash, result_hash, tiles)
+
+
+def apply_delta(base, delta):
+    """
+    Patch the changed tiles into a payload in place
+
+    Args:
+        base: bytearray holding the payload the delta was computed against
+        delta: TileDelta from parse_delta
+
+    Returns:
+        List of (x0, y0, x1, y1) rectangles, end-exclusive, of the patched tiles (frame orientation)
+
+    Raises:
+        ValueError if base is not the delta's base frame (base untouched), or if the patched
+        payload does not match the result hash (base is then corrupt and must be dropped)
+    """
+    stride = delta.width // 8
+    if len(base) != stride * delta.height or payload_hash(base) != delta.base_hash:
+        raise ValueError("Tile delta does not apply to the cached frame")
+    tile_bytes = delta.tile_width // 8
+    tile_cols = delta.width // delta.tile_width
+    rects = []
+    for index, tile in delta.tiles:
+        tile_row, col = divmod(index, tile_cols)
+        x0, y0 = col * delta.tile_width, tile_row * delta.tile_height
+        for row in range(delta.tile_height):
+            start = (y0 + row) * stride + col * tile_bytes
+            base[start:start + tile_bytes] = tile[row * tile_bytes:(row + 1) * tile_bytes]
+        rects.append((x0, y0, x0 + delta.tile_width, y0 + delta.tile_height))
+    if payload_hash(base) != delta.result_hash:
+        raise ValueError("Patched frame does not match the tile delta's result hash")
+    return rects
+
+
+def rotate_rects_180(rects, width, height):
+    """Map rectangles of a frame onto the same frame rotated by 180 degrees"""
+    return [(width - x1, height - y1, width - x0, height - y0) for x0, y0, x1, y1 in rects]
+
+
+def to_panel_buffer(frame, black_is_one):
+    """
+    Turn a parsed frame into the buffer epd.display expects
+
+    Args:
+        frame: PackedFrame from parse_frame
+        black_is_one: True if the driver's getbuffer sets bits for black pixels
+
+    Returns:
+        bytes ready for epd.display
+    """
+    buffer = frame.payload
+    if bool(frame.flags & FLAG_BLACK_IS_ONE) != black_is_one:
+        buffer = bytes(buffer).translate(INVERT_TABLE)
+    if frame.rotation == 180:
+        buffer = rotate_180(buffer)
+    return bytes(buffer)
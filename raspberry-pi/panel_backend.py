@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Panel backends for the QuietDash.io display scripts
+The scripts only talk to the panel through the Waveshare EPD interface:
+
+    width, height                       panel size in pixels (landscape)
+    init(), init_fast(), init_part()    wake the controller in full, fast or partial refresh mode
+    getbuffer(image)                    pack a PIL image into the panel's 1-bit buffer (set bits = black)
+    display(buffer)                     full refresh with a packed buffer
+    display_Partial(buffer, x0, y0, x1, y1)  refresh one byte-aligned region (buffer holds only that region)
+    Clear()                             full refresh to white
+    sleep()                             deep sleep until the next init
+
+The real driver (waveshare_epd.<device>) is one backend and is imported only when a panel is
+created, so the scripts can be imported, profiled and benchmarked on any Linux box with
+QUIETDASH_PANEL=virtual: the virtual panel keeps what is on screen in memory, can write every
+refresh to a PNG, and sleeps like the real panel would while refreshing.
+"""
+
+import os
+import time
+import logging
+import importlib
+from collections import Counter
+
+from PIL import Image
+
+from packed_frame import INVERT_TABLE
+from panel_config import DEFAULT_DEVICE
+from panel_state import MODE_FAST, MODE_FULL, MODE_PARTIAL
+
+# Panel backend: 'waveshare' (SPI/GPIO driver) or 'virtual' (headless, in memory)
+PANEL_BACKEND = os.getenv('QUIETDASH_PANEL', 'waveshare')
+
+# Device name that selects the virtual panel for a single entry of a panels file
+VIRTUAL_DEVICE = 'virtual'
+
+# Directory the virtual panel writes a PNG of every refresh to (empty = memory only)
+VIRTUAL_OUTPUT_DIR = os.getenv('QUIETDASH_VIRTUAL_OUTPUT', '')
+
+# Scale of the simulated refresh times (1 = as slow as the 7.5" V2 panel, 0 = instant)
+VIRTUAL_TIME_SCALE = float(os.getenv('QUIETDASH_VIRTUAL_TIME_SCALE', '1'))
+
+# Refresh durations of the Waveshare 7.5" V2 panel, in seconds
+FULL_REFRESH_SECONDS = 4.0
+FAST_REFRESH_SECONDS = 1.5
+PARTIAL_REFRESH_SECONDS = 0.4
+
+
+class VirtualEPD:
+    """Headless stand-in for epd7in5_V2.EPD that keeps the panel content in memory"""
+
+    width = 800
+    height = 480
+
+    def __init__(self, name=None, output_dir=VIRTUAL_OUTPUT_DIR, time_scale=VIRTUAL_TIME_SCALE):
+        """
+        Args:
+            name: Panel name, prefixes the PNG files when several virtual panels share a directory
+            output_dir: Directory for a PNG of every refresh (empty = memory only)
+            time_scale: Scale of the simulated refresh durations (0 = instant)
+        """
+        self.name = name
+        self.output_dir = output_dir
+        self.full_refresh_time = FULL_REFRESH_SECONDS * time_scale
+        self.fast_refresh_time = FAST_REFRESH_SECONDS * time_scale
+        self.partial_refresh_time = PARTIAL_REFRESH_SECONDS * time_scale
+        self.stride = self.width // 8
+        # Packed content of the panel, white after power-up
+        self.framebuffer = bytearray(self.stride * self.height)
+        self.mode = None
+        self.asleep = True
+        # Refreshes by kind ('full', 'fast', 'partial', 'clear') and the simulated time spent in them
+        self.refreshes = Counter()
+        self.busy_seconds = 0.0
+
+    def _init(self, mode):
+        self.mode = mode
+        self.asleep = False
+        return 0
+
+    def init(self):
+        return self._init(MODE_FULL)
+
+    def init_fast(self):
+        return self._init(MODE_FAST)
+
+    def init_part(self):
+        return self._init(MODE_PARTIAL)
+
+    def getbuffer(self, image):
+        """Pack an image like the V2 driver: portrait images are turned to landscape, set bits are black"""
+        if image.size == (self.height, self.width):
+            image = image.rotate(90, expand=True)
+        elif image.size != (self.width, self.height):
+            logging.warning(f"Wrong image dimensions {image.size}, expected {self.width}x{self.height}")
+            return bytearray(self.stride * self.height)
+        return bytearray(image.convert('1').tobytes().translate(INVERT_TABLE))
+
+    def _refresh(self, kind, seconds):
+        if self.asleep:
+            logging.warning(f"Virtual panel: {kind} refresh while the controller is asleep (missing init)")
+        self.refreshes[kind] += 1
+        self.busy_seconds += seconds
+        if seconds:
+            time.sleep(seconds)
+        if self.output_dir:
+            self.save(os.path.join(self.output_dir, self._frame_name()))
+
+    def _frame_name(self):
+        count = sum(self.refreshes.values())
+        return f'{self.name}-{count:05d}.png' if self.name else f'frame-{count:05d}.png'
+
+    def display(self, buffer):
+        if len(buffer) != len(self.framebuffer):
+            raise ValueError(f"Buffer of {len(buffer)} bytes, the panel needs {len(self.framebuffer)}")
+        self.framebuffer[:] = buffer
+        if self.mode == MODE_FAST:
+            self._refresh('fast', self.fast_refresh_time)
+        else:
+            self._refresh('full', self.full_refresh_time)
+
+    def display_Partial(self, buffer, x0, y0, x1, y1):
+        if x0 % 8 or x1 % 8:
+            raise ValueError(f"Partial region ({x0}, {y0})-({x1}, {y1}) is not byte aligned")
+        row_bytes = (x1 - x0) // 8
+        if len(buffer) != row_bytes * (y1 - y0):
+            raise ValueError(f"Buffer of {len(buffer)} bytes for a {x1 - x0}x{y1 - y0} region")
+        for row in range(y1 - y0):
+            start = (y0 + row) * self.stride + x0 // 8
+            self.framebuffer[start:start + row_bytes] = buffer[row * row_bytes:(row + 1) * row_bytes]
+        self._refresh('partial', self.partial_refresh_time)
+
+    def Clear(self):
+        self.framebuffer[:] = bytes(len(self.framebuffer))
+        self._refresh('clear', self.full_refresh_time)
+
+    def sleep(self):
+        self.asleep = True
+        self.mode = None
+
+    def image(self):
+        """What the panel shows, as a 1-bit PIL image"""
+        return Image.frombytes('1', (self.width, self.height), bytes(self.framebuffer.translate(INVERT_TABLE)))
+
+    def save(self, path):
+        """Write what the panel shows to a PNG file"""
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.image().save(path)
+        except OSError as e:
+            logging.warning(f"Virtual panel: could not write {path}: {e}")
+
+
+def create_panel(device=DEFAULT_DEVICE, name=None, backend=PANEL_BACKEND):
+    """
+    Create the EPD object for a panel
+
+    Args:
+        device: Waveshare driver module (waveshare_epd.<device>), or 'virtual'
+        name: Panel name (used by the virtual panel for its PNG files)
+        backend: 'waveshare' or 'virtual' (QUIETDASH_PANEL)
+
+    Returns:
+        EPD instance, not initialized yet
+
+    Raises:
+        ValueError: Unknown backend
+        ImportError: The Waveshare library is not installed
+    """
+    if backend == VIRTUAL_DEVICE or device == VIRTUAL_DEVICE:
+        logging.info("Using the virtual panel" + (f", writing frames to {VIRTUAL_OUTPUT_DIR}" if VIRTUAL_OUTPUT_DIR else ""))
+        return VirtualEPD(name=name)
+    if backend != 'waveshare':
+        raise ValueError(f"Unknown panel backend {backend!r}, expected 'waveshare' or 'virtual'")
+    return importlib.import_module(f'waveshare_epd.{device}').EPD()
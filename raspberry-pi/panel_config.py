@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Multi-panel configuration for the QuietDash.io display client
+Lets one client process drive several panels, each with its own account, dashboard and device.
+
+Example panels.json (keep it readable by the service user only, it holds passwords):
+    {
+        "panels": [
+            {"name": "hall", "email": "hall@example.com", "password": "...", "dashboard_id": "42"},
+            {"name": "desk", "email": "desk@example.com", "password": "...", "device": "epd7in5_V2",
+             "dither": "threshold"}
+        ]
+    }
+"""
+
+import re
+import json
+from collections import namedtuple
+
+from dithering import ALGORITHMS
+
+# Default Waveshare driver module (waveshare_epd.<device>)
+DEFAULT_DEVICE = 'epd7in5_V2'
+
+# Everything the client needs to know about one panel (dither None = QUIETDASH_DITHER)
+PanelConfig = namedtuple('PanelConfig', ['name', 'email', 'password', 'dashboard_id', 'device', 'dither'],
+                         defaults=(None,))
+
+# Panel names double as state sub-directory names
+PANEL_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def load_panels(path):
+    """
+    Read the panel list from a JSON file
+
+    Args:
+        path: JSON file holding {"panels": [...]} or a bare list of panel objects
+
+    Returns:
+        list of PanelConfig
+
+    Raises:
+        ValueError if the file is not valid JSON or a panel entry is incomplete
+        OSError if the file cannot be read
+    """
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Invalid panel configuration {path}: {e}")
+
+    entries = data.get('panels') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"No panels defined in {path}")
+
+    panels = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Panel #{index + 1} in {path} is not an object")
+        name = str(entry.get('name') or f'panel{index + 1}')
+        if not PANEL_NAME.match(name):
+            raise ValueError(f"Invalid panel name '{name}' (letters, digits, '.', '_' and '-' only)")
+        if any(panel.name == name for panel in panels):
+            raise ValueError(f"Duplicate panel name '{name}' in {path}")
+        if not entry.get('email') or not entry.get('password'):
+            raise ValueError(f"Panel '{name}' needs an email and a password")
+        dashboard_id = entry.get('dashboard_id')
+        dither = entry.get('dither')
+        if dither is not None and dither not in ALGORITHMS:
+            raise ValueError(f"Panel '{name}' has unknown dither '{dither}' (choices: {', '.join(ALGORITHMS)})")
+        panels.append(PanelConfig(
+            name=name,
+            email=entry['email'],
+            password=entry['password'],
+            dashboard_id=str(dashboard_id) if dashboard_id is not None else None,
+            device=entry.get('device') or DEFAULT_DEVICE,
+            dither=dither,
+        ))
+    return panels
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Panel rotation on packed 1-bit buffers for the QuietDash.io dashboards
+Dashboards are drawn upright and packed once; the panel's mounting rotation is then applied to
+the packed buffer instead of to the PIL image, which saves a full-frame image copy:
+    180      reverse the byte order, then the bits of each byte (lookup table)
+    90, 270  transpose 8x8 pixel blocks (each held in one 64-bit word), then mirror
+
+Run `python3 panel_rotation.py` to benchmark both paths against PIL and check they agree.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from packed_frame import BIT_REVERSE_TABLE, INVERT_TABLE, rotate_180
+
+# Clockwise degrees the dashboards are turned to match how the panel is mounted (0, 90, 180 or 270);
+# the default suits the upside-down mount the dashboard scripts were written for
+PANEL_ROTATION = int(os.getenv('QUIETDASH_ROTATION', '180'))
+
+ROTATIONS = (0, 90, 180, 270)
+
+BIT_REVERSE = np.frombuffer(BIT_REVERSE_TABLE, dtype=np.uint8)
+
+
+def _transpose_blocks(words):
+    """Transpose the 8x8 bit matrix held in each uint64 (one byte per row, Hacker's Delight 7-3)"""
+    t = (words ^ (words >> np.uint64(7))) & np.uint64(0x00AA00AA00AA00AA)
+    words = words ^ t ^ (t << np.uint64(7))
+    t = (words ^ (words >> np.uint64(14))) & np.uint64(0x0000CCCC0000CCCC)
+    words = words ^ t ^ (t << np.uint64(14))
+    t = (words ^ (words >> np.uint64(28))) & np.uint64(0x00000000F0F0F0F0)
+    return words ^ t ^ (t << np.uint64(28))
+
+
+def transpose_packed(buffer, width, height):
+    """
+    Transpose a packed 1-bit frame (pixel (x, y) moves to (y, x))
+
+    Args:
+        buffer: Packed frame, rows of width / 8 bytes, most significant bit leftmost
+        width: Frame width in pixels (multiple of 8)
+        height: Frame height in pixels (multiple of 8)
+
+    Returns:
+        numpy uint8 array of shape (width, height / 8)
+    """
+    if width % 8 or height % 8:
+        raise ValueError(f"Cannot transpose a {width}x{height} frame, both sides must be multiples of 8")
+    stride = width // 8
+    # (block row, row in block, byte column) -> one 8-byte word per 8x8 block, first row most significant
+    blocks = np.frombuffer(bytes(buffer), dtype=np.uint8).reshape(height // 8, 8, stride).transpose(0, 2, 1)
+    words = _transpose_blocks(np.ascontiguousarray(blocks).view('>u8')[..., 0].astype(np.uint64))
+    # Block (i, j) lands at (j, i); its 8 bytes are 8 consecutive rows of the result
+    rows = np.ascontiguousarray(words.T).astype('>u8').view(np.uint8).reshape(stride, height // 8, 8)
+    return rows.transpose(0, 2, 1).reshape(width, height // 8)
+
+
+def rotate_packed(buffer, width, height, rotation):
+    """
+    Rotate a packed 1-bit frame clockwise
+
+    Args:
+        buffer: Packed frame (width / 8 bytes per row)
+        width: Frame width in pixels
+        height: Frame height in pixels
+        rotation: Clockwise degrees (0, 90, 180 or 270); 90 and 270 swap width and height
+
+    Returns:
+        bytes of the rotated frame
+    """
+    if rotation == 0:
+        return bytes(buffer)
+    if rotation == 180:
+        return rotate_180(buffer)
+    if rotation not in ROTATIONS:
+        raise ValueError(f"Unsupported rotation {rotation}, expected one of {ROTATIONS}")
+    transposed = transpose_packed(buffer, width, height)
+    if rotation == 90:
+        # Clockwise: mirror each row of the transpose (bytes reversed, then their bits)
+        return BIT_REVERSE[transposed[:, ::-1]].tobytes()
+    # Counter-clockwise: reverse the row order of the transpose
+    return transposed[::-1].tobytes()
+
+
+def canvas_size(epd, rotation=PANEL_ROTATION):
+    """Size (width, height) to draw a dashboard at, upright, for a panel mounted with this rotation"""
+    if rotation in (90, 270):
+        return epd.height, epd.width
+    return epd.width, epd.height
+
+
+def pack_image(epd, image, rotation=PANEL_ROTATION):
+    """
+    Pack an upright dashboard image into the panel buffer, turned by the panel rotation
+
+    Args:
+        epd: EPD instance (see panel_backend.py)
+        image: Dashboard drawn at canvas_size(epd, rotation)
+        rotation: Clockwise degrees to turn it by
+
+    Returns:
+        Packed buffer for epd.display
+    """
+    if rotation in (0, 180):
+        buffer = epd.getbuffer(image)
+        return rotate_180(buffer) if rotation == 180 else buffer
+    # Portrait canvas: pack it as is (set bits = black, as the Waveshare drivers do), then rotate
+    packed = image.convert('1').tobytes().translate(INVERT_TABLE)
+    return rotate_packed(packed, image.width, image.height, rotation)
+
+
+def sample_dashboard(width, height):
+    """Synthetic 1-bit dashboard (text, lines and blocks) used by the benchmark"""
+    image = Image.new('1', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height - 20, 24):
+        draw.text((10, row), f"Line {row // 24:02d} of the benchmark dashboard", fill=0)
+    for index in range(12):
+        draw.rectangle((width // 2 + index * 13, height // 3, width // 2 + index * 13 + 7, height - 30), fill=index % 2 * 255)
+    draw.line((0, 0, width - 1, height - 1), fill=0, width=3)
+    return image
+
+
+def benchmark(epd, repeat=20):
+    """
+    Time the PIL path (rotate the image, then getbuffer) against rotating the packed buffer
+
+    Args:
+        epd: EPD instance providing width, height and getbuffer
+        repeat: Runs per measurement (the best one is kept)
+
+    Returns:
+        list of (rotation, PIL seconds, packed seconds, identical) tuples
+    """
+    pil_transpose = {90: Image.Transpose.ROTATE_270, 180: Image.Transpose.ROTATE_180, 270: Image.Transpose.ROTATE_90}
+
+    def best(function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+        return min(timings), bytes(result)
+
+    results = []
+    for rotation in (90, 180, 270):
+        image = sample_dashboard(*canvas_size(epd, rotation))
+        pil_seconds, expected = best(lambda: epd.getbuffer(image.transpose(pil_transpose[rotation])))
+        packed_seconds, actual = best(lambda: pack_image(epd, image, rotation))
+        results.append((rotation, pil_seconds, packed_seconds, expected == actual))
+    return results
+
+
+def main():
+    """Print the rotation benchmark for the panel given by QUIETDASH_PANEL (virtual by default here)"""
+    from panel_backend import VirtualEPD, create_panel
+    epd = create_panel() if os.getenv('QUIETDASH_PANEL') else VirtualEPD(time_scale=0)
+    print(f"{'rotation':>8} {'PIL (ms)':>10} {'packed (ms)':>12} {'identical':>10}")
+    for rotation, pil_seconds, packed_seconds, identical in benchmark(epd):
+        print(f"{rotation:>8} {pil_seconds * 1000:>10.2f} {packed_seconds * 1000:>12.2f} {str(identical):>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
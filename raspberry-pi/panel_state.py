@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Panel power/mode state machine for the Waveshare 7.5" e-Paper V2
+Tracks whether the controller is asleep or awake in full, fast or partial refresh mode and only
+issues the init call an update actually needs: consecutive refreshes of the same kind share one
+wake-up, and a panel that ends up not being refreshed (identical frame) is never woken at all.
+Every transition is counted and timed.
+
+    asleep  --init()-------> full      (clean refresh, flashes, clears ghosting)
+    asleep  --init_fast()--> fast      (quicker full refresh, some ghosting stays)
+    asleep  --init_part()--> partial   (display_Partial of changed regions)
+    any     --sleep()------> asleep    (deep sleep, content stays on the panel)
+
+Partial refreshes diff against the previous frame held in the controller's RAM, which is lost in
+deep sleep and on power-up; only a full refresh (or Clear) in the same wake cycle reloads it.
+"""
+
+import logging
+from contextlib import nullcontext
+
+# Controller asleep, or not initialized since power-up: the next refresh needs an init
+ASLEEP = 'asleep'
+
+# Awake modes, each entered by its own init call
+MODE_FULL = 'full'
+MODE_FAST = 'fast'
+MODE_PARTIAL = 'partial'
+
+INIT_CALLS = {
+    MODE_FULL: 'init',
+    MODE_FAST: 'init_fast',
+    MODE_PARTIAL: 'init_part',
+}
+
+
+class PanelState:
+    """Drives the controller's init/sleep calls and remembers which mode it was left in"""
+
+    def __init__(self, epd, state=ASLEEP, metrics=None):
+        """
+        Args:
+            epd: EPD instance (see panel_backend.py)
+            state: State the caller left the controller in (MODE_FULL after epd.init()),
+                None if unknown (the next refresh always re-initializes)
+            metrics: Optional metrics.PanelMetrics receiving transition counts and timings
+        """
+        self.epd = epd
+        self.state = state
+        self.metrics = metrics
+        # The controller's old-frame RAM holds the frame on screen (a full refresh since waking up)
+        self.synced = False
+
+    def _timer(self, stage, **labels):
+        return self.metrics.timer(stage, **labels) if self.metrics else nullcontext()
+
+    def _transition(self, new_state):
+        if self.metrics:
+            self.metrics.inc('panel_transitions_total', **{'from': self.state or 'unknown', 'to': new_state})
+        self.state = new_state
+
+    def supports(self, mode):
+        """True if the driver has the init call of this mode"""
+        return hasattr(self.epd, INIT_CALLS[mode])
+
+    def enter(self, mode):
+        """
+        Make sure the controller is awake in the given mode
+
+        Modes the driver lacks fall back to MODE_FULL.
+
+        Returns:
+            True if an init call was needed
+        """
+        if not self.supports(mode):
+            mode = MODE_FULL
+        if self.state == mode:
+            return False
+        if self.state in (ASLEEP, None):
+            self.synced = False
+        with self._timer('epd_init', mode=mode):
+            try:
+                getattr(self.epd, INIT_CALLS[mode])()
+            except Exception:
+                self.state = None
+                raise
+        self._transition(mode)
+        return True
+
+    def clear(self):
+        """Full refresh to white (awake in full mode afterwards)"""
+        self.enter(MODE_FULL)
+        with self._timer('epd_clear'):
+            self.epd.Clear()
+        self.synced = True
+
+    def sleep(self):
+        """
+        Put the controller into deep sleep, unless it already is
+
+        Returns:
+            True if a sleep call was needed
+        """
+        self.synced = False
+        if self.state == ASLEEP:
+            return False
+        with self._timer('epd_sleep'):
+            try:
+                self.epd.sleep()
+            except Exception:
+                self.state = None
+                raise
+        self._transition(ASLEEP)
+        return True
+
+    def forget(self):
+        """Mark the controller state as unknown, e.g. after a failed refresh"""
+        if self.state is not None:
+            logging.info("Panel state unknown, the next refresh re-initializes the controller")
+        self.state = None
+        self.synced = False
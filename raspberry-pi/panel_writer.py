@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Coalescing panel writer for the QuietDash.io display client
+A full refresh blocks the calling thread for seconds. The writer thread owns the panels instead:
+the update loops hand it frames without waiting, each panel has a single-slot mailbox where a
+newer frame replaces one that has not been shown yet, and all panel I/O stays on one thread so
+panels sharing the SPI bus are never driven concurrently.
+"""
+
+import time
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+
+# Longest wait for the refresh in progress when stopping (a few full refreshes of the 7.5" panel)
+WRITER_STOP_TIMEOUT = 30
+
+
+class PanelWriter(threading.Thread):
+    """Shows submitted frames one at a time; the latest frame submitted for a panel wins"""
+
+    def __init__(self, show, keep_pending=None):
+        """
+        Args:
+            show: Blocking callable (display, frame) pushing a frame (or the fallback) to a panel
+            keep_pending: Optional callable (frame, pending) returning True when a pending frame must not
+                be replaced by the new one (e.g. a failed fetch must not discard a fetched frame)
+        """
+        super().__init__(name='panel-writer', daemon=True)
+        self.show = show
+        self.keep_pending = keep_pending
+        self.condition = threading.Condition()
+        # display -> (frame, monotonic start of its update), oldest submission first
+        self.pending = OrderedDict()
+        self.stopped = False
+        self.superseded = 0
+
+    def submit(self, display, frame, started=None):
+        """
+        Hand a frame to the writer without waiting for the panel
+
+        Args:
+            display: QuietDashDisplay the frame is for
+            frame: Frame as returned by prepare_api_frame
+            started: Monotonic time the update started, to measure it up to the end of the refresh
+        """
+        started = time.monotonic() if started is None else started
+        with self.condition:
+            if self.stopped:
+                return
+            if display in self.pending:
+                pending = self.pending[display][0]
+                if self.keep_pending is not None and self.keep_pending(frame, pending):
+                    return
+                # Same slot: the panel keeps its place in the queue
+                self.superseded += 1
+                display.metrics.inc('frames_superseded_total')
+                logging.info("Panel still busy, a newer frame replaces the one waiting to be shown")
+            self.pending[display] = (frame, started)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.stopped)
+                if self.stopped:
+                    return
+                display, (frame, started) = self.pending.popitem(last=False)
+            try:
+                self.show(display, frame)
+                display.record_update_time(time.monotonic() - started)
+            except Exception as e:
+                logging.error(f"Panel update failed: {e}")
+                logging.error(traceback.format_exc())
+
+    def stop(self, timeout=WRITER_STOP_TIMEOUT):
+        """
+        Drop frames not shown yet and wait for the refresh in progress to finish
+
+        Returns:
+            True if the writer stopped, False if the refresh was still running after timeout seconds
+        """
+        with self.condition:
+            self.stopped = True
+            self.pending.clear()
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+        if self.is_alive():
+            logging.warning(f"Panel refresh still running after {timeout}s, shutting down without waiting for it")
+            return False
+        return True
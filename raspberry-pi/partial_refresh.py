@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Dirty-rectangle partial refresh for the Waveshare 7.5" e-Paper V2
+Diffs the previous and next packed 1-bit frames and only refreshes the regions that changed
+"""
+
+import os
+import logging
+from contextlib import nullcontext
+
+from frame_store import FrameStore
+from ghosting import PARTIAL, GhostingPolicy
+from panel_state import ASLEEP, MODE_FAST, MODE_FULL, MODE_PARTIAL, PanelState
+
+# Partial updates a region may get before a full refresh clears its ghosting (0 disables partial refresh)
+FULL_REFRESH_EVERY = int(os.getenv('QUIETDASH_FULL_REFRESH_EVERY', '10'))
+
+# Large content changes, with ghosting still below its limits, use the quicker fast full refresh (init_fast)
+FAST_FULL_REFRESH = os.getenv('QUIETDASH_FAST_REFRESH', '1') == '1'
+
+# Diff granularity: tiles of TILE_WIDTH_BYTES * 8 pixels by TILE_HEIGHT rows
+TILE_WIDTH_BYTES = 2
+TILE_HEIGHT = 16
+
+# Every display_Partial call is its own refresh, so beyond this many regions they are merged into one
+MAX_PARTIAL_REGIONS = 4
+
+# Above this share of the panel a full refresh is cheaper and cleaner than a partial one
+MAX_PARTIAL_AREA = 0.5
+
+
+def _dirty_tiles(previous, current, width, height):
+    """
+    Mark which diff tiles differ between two packed frames
+
+    Returns:
+        List of rows (one per tile row) of booleans (one per tile column)
+    """
+    stride = width // 8
+    tile_cols = (stride + TILE_WIDTH_BYTES - 1) // TILE_WIDTH_BYTES
+    tile_rows = (height + TILE_HEIGHT - 1) // TILE_HEIGHT
+    dirty = [[False] * tile_cols for _ in range(tile_rows)]
+
+    for y in range(height):
+        row_start = y * stride
+        row_end = row_start + stride
+        if previous[row_start:row_end] == current[row_start:row_end]:
+            continue
+        tiles = dirty[y // TILE_HEIGHT]
+        for col in range(tile_cols):
+            if tiles[col]:
+                continue
+            start = row_start + col * TILE_WIDTH_BYTES
+            end = min(start + TILE_WIDTH_BYTES, row_end)
+            if previous[start:end] != current[start:end]:
+                tiles[col] = True
+    return dirty
+
+
+def _rect_tiles(rects, width, height):
+    """Mark the diff tiles overlapped by any of the given pixel rectangles"""
+    tile_width = TILE_WIDTH_BYTES * 8
+    tile_cols = (width // 8 + TILE_WIDTH_BYTES - 1) // TILE_WIDTH_BYTES
+    tile_rows = (height + TILE_HEIGHT - 1) // TILE_HEIGHT
+    dirty = [[False] * tile_cols for _ in range(tile_rows)]
+    for x0, y0, x1, y1 in rects:
+        for row in range(max(0, y0 // TILE_HEIGHT), min(tile_rows, (y1 + TILE_HEIGHT - 1) // TILE_HEIGHT)):
+            for col in range(max(0, x0 // tile_width), min(tile_cols, (x1 + tile_width - 1) // tile_width)):
+                dirty[row][col] = True
+    return dirty
+
+
+def diff_regions(previous, current, width, height):
+    """
+    Compute the changed rectangles between two packed 1-bit frames
+
+    Args:
+        previous: Packed frame currently on the panel
+        current: Packed frame about to be shown
+        width: Panel width in pixels (multiple of 8)
+        height: Panel height in pixels
+
+    Returns:
+        List of (x0, y0, x1, y1) pixel rectangles, end-exclusive, with x0/x1 byte-aligned
+    """
+    previous = bytes(previous)
+    current = bytes(current)
+    if len(previous) != len(current):
+        raise ValueError(f"Frame sizes differ: {len(previous)} vs {len(current)} bytes")
+    return _merge_tiles(_dirty_tiles(previous, current, width, height), width, height)
+
+
+def changed_regions(rects, width, height):
+    """
+    Refresh regions for changes that are already known (e.g. the tiles patched by a frame delta)
+
+    Same output as diff_regions, without reading either frame.
+    """
+    return _merge_tiles(_rect_tiles(rects, width, height), width, height)
+
+
+def _merge_tiles(dirty, width, height):
+    """Merge a dirty tile grid into at most MAX_PARTIAL_REGIONS rectangles"""
+    stride = width // 8
+
+    # Greedy merge: horizontal runs of dirty tiles, extended downwards while the run below matches
+    regions = []
+    open_runs = {}
+    for row, tiles in enumerate(dirty + [[]]):
+        runs = []
+        col = 0
+        while col < len(tiles):
+            if tiles[col]:
+                start = col
+                while col < len(tiles) and tiles[col]:
+                    col += 1
+                runs.append((start, col))
+            else:
+                col += 1
+
+        next_open = {}
+        for run in runs:
+            next_open[run] = open_runs.pop(run, row)
+        for (start, end), first_row in open_runs.items():
+            regions.append((
+                start * TILE_WIDTH_BYTES * 8,
+                first_row * TILE_HEIGHT,
+                min(end * TILE_WIDTH_BYTES, stride) * 8,
+                min(row * TILE_HEIGHT, height),
+            ))
+        open_runs = next_open
+
+    regions.sort(key=lambda r: (r[1], r[0]))
+    if len(regions) > MAX_PARTIAL_REGIONS:
+        regions = [bounding_box(regions)]
+    return regions
+
+
+def bounding_box(regions):
+    """Smallest rectangle covering every region"""
+    return (
+        min(r[0] for r in regions),
+        min(r[1] for r in regions),
+        max(r[2] for r in regions),
+        max(r[3] for r in regions),
+    )
+
+
+def crop_region(buffer, width, region):
+    """
+    Extract the packed bytes of a byte-aligned region, as display_Partial expects them
+
+    Args:
+        buffer: Full packed frame
+        width: Panel width in pixels
+        region: (x0, y0, x1, y1) rectangle with x0/x1 multiples of 8
+
+    Returns:
+        bytearray of ((x1 - x0) / 8) * (y1 - y0) bytes
+    """
+    x0, y0, x1, y1 = region
+    stride = width // 8
+    byte_start = x0 // 8
+    byte_end = x1 // 8
+    out = bytearray()
+    for y in range(y0, y1):
+        row = y * stride
+        out += buffer[row + byte_start:row + byte_end]
+    return out
+
+
+class PartialRefresher:
+    """Pushes frames to the panel, refreshing only the regions that changed"""
+
+    def __init__(self, epd, frame_store=None, full_refresh_every=FULL_REFRESH_EVERY, mode=ASLEEP, metrics=None,
+                 fast_refresh=FAST_FULL_REFRESH):
+        """
+        Args:
+            epd: EPD instance (see panel_backend.py), initialized on demand
+            frame_store: FrameStore holding the frame currently on the panel
+            full_refresh_every: Partial updates allowed between two full refreshes
+            mode: State the caller left the controller in (see panel_state.py), None if unknown
+            metrics: Optional metrics.PanelMetrics receiving panel timings and refresh counts
+            fast_refresh: Use fast full refreshes for large changes that do not need ghosting cleared
+        """
+        self.epd = epd
+        self.metrics = metrics
+        self.frame_store = frame_store or FrameStore()
+        self.full_refresh_every = full_refresh_every
+        self.fast_refresh = fast_refresh
+        self.panel = PanelState(epd, mode, metrics)
+        self.ghosting = None
+        # Per-region pixel flips of the partial refresh being planned (see ghosting.py)
+        self.pending_flips = None
+        # The full refresh being planned is only needed for the size of the change, not for ghosting
+        self.pending_fast = False
+        self.supports_partial = hasattr(epd, 'init_part') and hasattr(epd, 'display_Partial')
+        if not self.supports_partial:
+            logging.warning("e-Paper driver has no partial refresh support, using full refreshes only")
+
+    def _timer(self, stage, **labels):
+        return self.metrics.timer(stage, **labels) if self.metrics else nullcontext()
+
+    def _count(self, kind):
+        if self.metrics:
+            self.metrics.inc('refreshes_total', kind=kind)
+
+    @property
+    def mode(self):
+        """Controller state (see panel_state.py)"""
+        return self.panel.state
+
+    def invalidate(self):
+        """Forget the controller state, e.g. after a failed refresh"""
+        self.panel.forget()
+
+    def enter_mode(self, mode):
+        """Wake the controller in the given refresh mode, if it is not in it already"""
+        self.panel.enter(mode)
+
+    def clear(self):
+        """Refresh the panel to white; the frame on it is unknown afterwards"""
+        self.panel.clear()
+        self.frame_store.forget()
+
+    def sleep(self):
+        """Put the controller into deep sleep (the frame stays on the panel)"""
+        self.panel.sleep()
+
+    def _plan(self, buffer, force_full, changed=None):
+        """Decide between a full refresh (returns None) and a list of partial regions"""
+        self.pending_fast = False
+        if force_full or not self.supports_partial or self.full_refresh_every <= 0:
+            return None
+
+        previous = self.frame_store.load_frame()
+        if previous is None or len(previous) != len(buffer):
+            return None
+        if not self.panel.synced:
+            # Asleep, just powered up or state unknown: the controller's old-frame RAM does not hold
+            # the frame in the frame store, so a partial refresh would diff against garbage
+            logging.info("No full refresh since the controller woke up, using a full refresh")
+            self._count_full_reason('wake')
+            return None
+
+        width, height = self.epd.width, self.epd.height
+        # The counters live in the frame metadata, so they follow the panel content (and survive restarts)
+        if self.ghosting is None:
+            self.ghosting = GhostingPolicy(width, height, self.full_refresh_every)
+        self.ghosting.load_meta(self.frame_store.meta.get('ghosting'), self.frame_store.meta.get('partial_updates', 0))
+        decision, self.pending_flips = self.ghosting.plan(previous, buffer)
+        if decision != PARTIAL:
+            self._count_full_reason(decision)
+            return None
+
+        if changed is not None:
+            regions = changed_regions(changed, width, height)
+        else:
+            regions = diff_regions(previous, buffer, width, height)
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+        if area > MAX_PARTIAL_AREA * width * height:
+            logging.info(f"{area * 100 // (width * height)}% of the panel changed, using a full refresh")
+            self._count_full_reason('area')
+            # Ghosting is below its limits, so the quicker fast refresh is clean enough
+            self.pending_fast = self.fast_refresh
+            return None
+        return regions
+
+    def _count_full_reason(self, reason):
+        if self.metrics:
+            self.metrics.inc('full_refresh_reasons_total', reason=reason)
+
+    def show(self, buffer, force_full=False, changed=None):
+        """
+        Display a packed frame with the cheapest refresh that is still clean
+
+        Args:
+            buffer: Packed frame as returned by epd.getbuffer
+            force_full: Always do a full refresh
+            changed: Rectangles known to hold every difference from the frame on the panel,
+                used instead of diffing the two frames
+
+        Returns:
+            'skipped', 'partial', 'fast' or 'full' depending on what reached the panel
+        """
+        buffer = bytes(buffer)
+        if self.frame_store.is_unchanged(buffer):
+            logging.info("Frame identical to the one on the panel, skipping refresh")
+            self._count('skipped')
+            return 'skipped'
+
+        regions = self._plan(buffer, force_full, changed)
+        if regions:
+            partial_updates = self.frame_store.meta.get('partial_updates', 0) + 1
+            self.enter_mode(MODE_PARTIAL)
+            with self._timer('epd_display', kind='partial'):
+                for region in regions:
+                    x0, y0, x1, y1 = region
+                    logging.info(f"Partial refresh of region ({x0}, {y0})-({x1}, {y1})")
+                    self._display(self.epd.display_Partial, crop_region(buffer, self.epd.width, region), x0, y0, x1, y1)
+            self.ghosting.record_partial(self.pending_flips)
+            self.frame_store.record(buffer, partial_updates=partial_updates, ghosting=self.ghosting.to_meta())
+            self._count('partial')
+            return 'partial'
+
+        kind = MODE_FAST if self.pending_fast and self.panel.supports(MODE_FAST) else MODE_FULL
+        self.enter_mode(kind)
+        logging.info("Fast full refresh" if kind == MODE_FAST else "Full refresh")
+        with self._timer('epd_display', kind=kind):
+            self._display(self.epd.display, buffer)
+        self.panel.synced = True
+        if kind == MODE_FAST:
+            # A fast refresh does not fully clear ghosting: the regions keep their counters
+            partial_updates = self.frame_store.meta.get('partial_updates', 0)
+            self.frame_store.record(buffer, partial_updates=partial_updates, ghosting=self.ghosting.to_meta())
+        else:
+            self.frame_store.record(buffer, partial_updates=0)
+        self._count(kind)
+        return kind
+
+    def _display(self, call, *args):
+        """Issue a refresh call; after a failure the controller state is unknown"""
+        try:
+            call(*args)
+        except Exception:
+            self.panel.forget()
+            raise
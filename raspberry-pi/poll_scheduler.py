@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Adaptive polling for the QuietDash.io display client
+Learns how often the dashboard actually changes and polls accordingly: quickly around
+expected changes, exponentially less often while the content stays the same.
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from statistics import median
+
+# Poll every QUIETDASH_REFRESH_INTERVAL seconds unless adaptive polling is enabled
+ADAPTIVE_POLLING = os.getenv('QUIETDASH_ADAPTIVE_POLLING', '0') == '1'
+
+# Bounds of the adaptive polling interval, in seconds
+MIN_REFRESH_INTERVAL = int(os.getenv('QUIETDASH_MIN_REFRESH_INTERVAL', '60'))
+MAX_REFRESH_INTERVAL = int(os.getenv('QUIETDASH_MAX_REFRESH_INTERVAL', '1800'))
+
+# Interval growth factor for every poll that finds the content unchanged
+POLL_BACKOFF = 2.0
+
+# Number of observed changes the change period is estimated from
+CHANGE_HISTORY = 8
+
+# Poll at the minimum interval within this fraction of the period around an expected change
+CHANGE_WINDOW = 0.1
+
+
+class PollScheduler:
+    """Chooses the delay before the next poll from the history of content changes"""
+
+    def __init__(self, base_interval, min_interval, max_interval, backoff=POLL_BACKOFF, history=CHANGE_HISTORY):
+        """
+        Args:
+            base_interval: Interval used until the first change has been observed
+            min_interval: Shortest delay between two polls
+            max_interval: Longest delay between two polls
+            backoff: Factor applied to the interval after each poll without change
+            history: Number of change timestamps kept to estimate the change period
+        """
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.interval = self._clamp(base_interval)
+        self.changes = deque(maxlen=history)
+        self.last_key = None
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    @property
+    def change_period(self):
+        """Median time between observed changes, or None until at least three changes were seen"""
+        if len(self.changes) < 3:
+            return None
+        times = list(self.changes)
+        return median(b - a for a, b in zip(times, times[1:]))
+
+    def observe(self, key, now=None):
+        """
+        Record the content returned by a poll
+
+        Args:
+            key: Identifies the content (e.g. frame hash); the first key seen is only a baseline
+            now: Observation time (defaults to time.time())
+
+        Returns:
+            True if the content changed since the previous poll
+        """
+        now = time.time() if now is None else now
+        changed = self.last_key is not None and key != self.last_key
+        self.last_key = key
+        if changed:
+            self.changes.append(now)
+            # Look again soon; once the period is known, next_interval wakes up for the next change anyway
+            period = self.change_period
+            self.interval = self._clamp(period) if period else self.min_interval
+        else:
+            self.observe_unchanged()
+        return changed
+
+    def observe_unchanged(self):
+        """Record a poll that found the content unchanged (e.g. HTTP 304)"""
+        self.interval = self._clamp(self.interval * self.backoff)
+
+    def next_interval(self, now=None):
+        """
+        Delay until the next poll
+
+        Follows the backoff interval, but wakes up for an expected change and polls at the
+        minimum interval while inside the window around it.
+        """
+        now = time.time() if now is None else now
+        interval = self.interval
+        period = self.change_period
+        if period:
+            expected = self.changes[-1] + period
+            window = max(self.min_interval, period * CHANGE_WINDOW)
+            if now < expected - window:
+                interval = min(interval, expected - window - now)
+            elif now <= expected + window:
+                interval = self.min_interval
+        return self._clamp(interval)
+
+    def describe(self):
+        """Short human-readable state for the logs"""
+        period = self.change_period
+        learned = f"content changes about every {period:.0f}s" if period else "change period not learned yet"
+        return f"{learned}, backoff interval {self.interval:.0f}s"
+
+
+def create_scheduler(refresh_interval):
+    """
+    Build the scheduler for the configured polling mode
+
+    Without adaptive polling, min and max are both refresh_interval, i.e. a fixed interval.
+    """
+    if not ADAPTIVE_POLLING:
+        return PollScheduler(refresh_interval, refresh_interval, refresh_interval)
+    logging.info(f"Adaptive polling between {MIN_REFRESH_INTERVAL}s and {MAX_REFRESH_INTERVAL}s")
+    return PollScheduler(refresh_interval, MIN_REFRESH_INTERVAL, MAX_REFRESH_INTERVAL)
@@ -18,7 +18,10 @@ libdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__)
 if os.path.exists(libdir):
     sys.path.append(libdir)
 
-from waveshare_epd import epd7in5_V2
+from panel_backend import create_panel
+from panel_rotation import canvas_size, pack_image
+from frame_store import FrameStore
+from partial_refresh import PartialRefresher
 
 # Configure logging
 logging.basicConfig(
@@ -127,6 +130,8 @@ class ProductivityDashboard:
 
     def __init__(self):
         self.epd = None
+        self.frame_store = FrameStore()
+        self.refresher = None
         self.display_width = DISPLAY_WIDTH
         self.display_height = DISPLAY_HEIGHT
 
@@ -134,12 +139,12 @@ class ProductivityDashboard:
         """Initialize the e-Paper display"""
         try:
             logging.info("Initializing 7.5inch e-Paper V2 display")
-            self.epd = epd7in5_V2.EPD()
-            self.epd.init()
+            self.epd = create_panel()
+            # The controller is woken on demand, in the mode the first refresh needs
+            self.refresher = PartialRefresher(self.epd, self.frame_store)
 
-            # Get display dimensions
-            self.display_width = self.epd.width
-            self.display_height = self.epd.height
+            # Get display dimensions (drawing canvas, upright for the panel rotation)
+            self.display_width, self.display_height = canvas_size(self.epd)
 
             logging.info(f"Display dimensions: {self.display_width}x{self.display_height}")
             logging.info("Display initialized successfully")
@@ -461,14 +466,11 @@ class ProductivityDashboard:
                         fill=0, width=1
                     )
 
-            # Rotate image 180 degrees for upside-down display
-            logging.info("Rotating image 180 degrees...")
-            image = image.rotate(180)
-
             # Display the image
             logging.info(f"Displaying dashboard on e-Paper (size: {image.size}, mode: {image.mode})...")
-            buffer = self.epd.getbuffer(image)
-            self.epd.display(buffer)
+            # Pack it and turn the packed buffer for the panel rotation (QUIETDASH_ROTATION)
+            buffer = pack_image(self.epd, image)
+            self.refresher.show(buffer)
             logging.info("Dashboard displayed successfully")
             return True
 
@@ -482,7 +484,7 @@ class ProductivityDashboard:
         if self.epd:
             try:
                 logging.info("Putting display to sleep...")
-                self.epd.sleep()
+                self.refresher.sleep()
             except Exception as e:
                 logging.error(f"Failed to put display to sleep: {e}")
 
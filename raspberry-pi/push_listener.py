@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Server-push refresh for the QuietDash.io display client
+Holds a Server-Sent Events connection and wakes the update loop when the server signals new content
+"""
+
+import re
+import logging
+import threading
+import requests
+
+# Seconds to wait before reconnecting after the event stream dropped
+PUSH_RETRY_INTERVAL = 30
+
+# Seconds to wait before probing again a server that has no event stream at all
+PUSH_UNAVAILABLE_RETRY_INTERVAL = 600
+
+# The server sends keepalive comments well within this read timeout
+PUSH_READ_TIMEOUT = 90
+
+# Largest read from the event stream; reads return as soon as some data arrived
+PUSH_READ_SIZE = 4096
+
+# SSE lines end with CRLF, CR or LF
+LINE_BREAK = re.compile(rb'\r\n|\r|\n')
+
+
+class SseParser:
+    """Incremental Server-Sent Events parser, fed one line at a time"""
+
+    def __init__(self):
+        self.event = None
+        self.data = []
+
+    def feed(self, line):
+        """
+        Args:
+            line: Decoded line without its terminator
+
+        Returns:
+            (event, data) once a blank line completes an event (event defaults to 'message'), else None
+        """
+        if line == '':
+            completed = None
+            if self.event is not None or self.data:
+                completed = (self.event or 'message', '\n'.join(self.data))
+            self.event = None
+            self.data = []
+            return completed
+        if line.startswith(':'):
+            # Comment, used by servers as keepalive
+            return None
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+        if field == 'event':
+            self.event = value
+        elif field == 'data':
+            self.data.append(value)
+        return None
+
+
+class SseLineSplitter:
+    """Split an event stream into lines on CR, LF or CRLF, fed chunks as they arrive from the network"""
+
+    def __init__(self):
+        self.pending = b''
+
+    def feed(self, chunk):
+        """
+        Args:
+            chunk: Bytes just received (lines may span chunks)
+
+        Returns:
+            list of the decoded lines completed by this chunk, without their terminators
+        """
+        pending = self.pending + chunk
+        lines = []
+        start = 0
+        for match in LINE_BREAK.finditer(pending):
+            if match.group() == b'\r' and match.end() == len(pending):
+                # May be the first half of a CRLF split across reads
+                break
+            lines.append(pending[start:match.start()].decode('utf-8', errors='replace'))
+            start = match.end()
+        self.pending = pending[start:]
+        return lines
+
+
+def iter_sse_lines(chunks):
+    """
+    Split an event stream into lines
+
+    Args:
+        chunks: Iterable of bytes as they arrive from the network (lines may span chunks)
+
+    Yields:
+        Decoded lines without their terminators
+    """
+    splitter = SseLineSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+
+
+def iter_response_chunks(response):
+    """Yield the body of a streamed response as data arrives, without waiting for a full buffer"""
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        # urllib3 < 2.2: chunk_size=None yields each chunk of a chunked response as it arrives
+        yield from response.iter_content(chunk_size=None)
+        return
+    while True:
+        data = read1(PUSH_READ_SIZE, decode_content=True)
+        if not data:
+            return
+        yield data
+
+
+def iter_sse_events(lines):
+    """
+    Parse a Server-Sent Events stream
+
+    Args:
+        lines: Iterable of decoded lines (without line terminators)
+
+    Yields:
+        (event, data) tuples; event defaults to 'message'
+    """
+    parser = SseParser()
+    for line in lines:
+        if line is None:
+            continue
+        completed = parser.feed(line)
+        if completed is not None:
+            yield completed
+
+
+class PushListener(threading.Thread):
+    """Background SSE client that records 'update' events from the API"""
+
+    def __init__(self, url, get_headers, on_unauthorized=None, wake=None):
+        """
+        Args:
+            url: Event stream URL (e.g. {API_BASE_URL}/display/events)
+            get_headers: Callable returning request headers (authorization) for each connection
+            on_unauthorized: Callable invoked on 401 before reconnecting, e.g. to renew the token
+            wake: Optional shared threading.Event set together with changed (one loop, several listeners)
+        """
+        super().__init__(name='push-listener', daemon=True)
+        self.url = url
+        self.get_headers = get_headers
+        self.on_unauthorized = on_unauthorized
+        self.session = requests.Session()
+        self.changed = threading.Event()
+        self.wake = wake
+        self.stopped = threading.Event()
+        self.connected = False
+
+    def wait(self, timeout):
+        """
+        Block until the server signals new content or timeout seconds elapse
+
+        Returns:
+            True if woken by a push event, False on timeout (interval polling fallback)
+        """
+        pushed = self.changed.wait(timeout)
+        self.changed.clear()
+        return pushed
+
+    def signal(self):
+        """Flag new content for wait() and the shared wake event"""
+        self.changed.set()
+        if self.wake is not None:
+            self.wake.set()
+
+    def _listen(self):
+        """Hold one event stream connection; returns the delay before reconnecting"""
+        headers = dict(self.get_headers(), Accept='text/event-stream')
+        with self.session.get(self.url, headers=headers, stream=True, timeout=(10, PUSH_READ_TIMEOUT)) as response:
+            if response.status_code in (404, 405, 501):
+                logging.info(f"No event stream at {self.url} ({response.status_code}), using interval polling")
+                return PUSH_UNAVAILABLE_RETRY_INTERVAL
+            if response.status_code == 401:
+                logging.warning("Event stream rejected the access token")
+                if self.on_unauthorized:
+                    self.on_unauthorized()
+                return PUSH_RETRY_INTERVAL
+            response.raise_for_status()
+
+            self.connected = True
+            logging.info(f"Connected to event stream {self.url}")
+            # iter_lines would hold events back until a full chunk arrived (or read byte by byte)
+            lines = iter_sse_lines(iter_response_chunks(response))
+            for event, data in iter_sse_events(lines):
+                if event == 'update':
+                    logging.info(f"Server signalled new content ({data or 'no details'})")
+                    self.signal()
+                if self.stopped.is_set():
+                    break
+        return PUSH_RETRY_INTERVAL
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                delay = self._listen()
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Event stream disconnected: {e}")
+                delay = PUSH_RETRY_INTERVAL
+            except Exception as e:
+                logging.error(f"Event stream failed: {e}")
+                delay = PUSH_RETRY_INTERVAL
+            was_connected = self.connected
+            self.connected = False
+            if was_connected and not self.stopped.is_set():
+                # Content may change while we are disconnected, poll once to be safe
+                self.signal()
+            self.stopped.wait(delay)
+
+    def stop(self):
+        # Closing the stream from another thread can block until the read times out,
+        # so just flag the (daemon) thread; it exits on the next event or with the process
+        self.stopped.set()
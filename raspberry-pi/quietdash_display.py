@@ -9,8 +9,11 @@ import sys
 import os
 import logging
 import time
+import threading
+import signal
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 import traceback
 from dotenv import load_dotenv
@@ -30,7 +33,24 @@ libdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__)
 if os.path.exists(libdir):
     sys.path.append(libdir)
 
-from waveshare_epd import epd7in5_V2
+from frame_store import STATE_DIR, FrameStore, frame_hash
+from partial_refresh import PartialRefresher, MODE_FULL
+from token_manager import TokenCache, TokenManager, token_is_fresh
+from push_listener import PushListener
+from packed_frame import (
+    DELTA_CONTENT_TYPE, DELTA_IM, FRAME_CONTENT_TYPE, PackedFrame, apply_delta, parse_delta, parse_frame,
+    payload_hash, rotate_rects_180, to_panel_buffer,
+)
+from download_buffer import DownloadBuffer, MemoryReader
+from dithering import ALGORITHMS, DITHER_ALGORITHM, FLOYD_STEINBERG, dither
+from poll_scheduler import create_scheduler
+from circuit_breaker import CircuitBreaker
+from refresh_clock import RefreshClock
+from format_negotiation import CONTENT_ENCODINGS, MEDIA_RANGES, PACKED, FormatNegotiator, response_format
+from panel_config import DEFAULT_DEVICE, load_panels
+from panel_backend import create_panel
+from panel_writer import PanelWriter
+from metrics import METRICS
 
 # Configure logging first
 logging.basicConfig(
@@ -43,30 +63,197 @@ API_BASE_URL = os.getenv('QUIETDASH_API_URL', 'http://localhost:3000')
 API_EMAIL = os.getenv('QUIETDASH_EMAIL', 'test@example.com')
 API_PASSWORD = os.getenv('QUIETDASH_PASSWORD', 'password123')
 REFRESH_INTERVAL = int(os.getenv('QUIETDASH_REFRESH_INTERVAL', '300'))  # 5 minutes default
+# Fetch and convert the next frame this many seconds ahead of each refresh (0 = sequential loop)
+PREFETCH_LEAD = int(os.getenv('QUIETDASH_PREFETCH_LEAD', '0'))
+# Ask the API for pre-packed 1-bit frames that skip decode/resize/dither (PNG stays the fallback)
+RAW_FRAMES = os.getenv('QUIETDASH_RAW_FRAMES', '1') == '1'
+# Send the hash of the cached packed frame so the API can answer with only the changed tiles
+DELTA_FRAMES = os.getenv('QUIETDASH_DELTA_FRAMES', '1') == '1'
+# Refresh as soon as the server pushes a change over /display/events, polling stays as a fallback
+PUSH_ENABLED = os.getenv('QUIETDASH_PUSH', '0') == '1'
+LAST_FRAME_MAX_AGE = int(os.getenv('QUIETDASH_LAST_FRAME_MAX_AGE', '86400'))  # Don't restore frames older than a day
+LAST_FRAME_CONFIRM_EVERY = LAST_FRAME_MAX_AGE / 24  # Refresh the confirmation time of an unchanged last good frame this often
+# Dashboard to show (optional, the API picks the account's default dashboard otherwise)
+DASHBOARD_ID = os.getenv('QUIETDASH_DASHBOARD_ID') or None
+# Drive several panels from this process, as listed in a JSON file (see panel_config.py)
+PANELS_FILE = os.getenv('QUIETDASH_PANELS_FILE') or None
+# Push frames to the panel from a writer thread, so refreshes never block fetching and timers
+PANEL_WRITER = os.getenv('QUIETDASH_PANEL_WRITER', '1') == '1'
+# Run on the asyncio runtime (aiohttp client, panel I/O on an executor) instead of threads
+ASYNC_RUNTIME = os.getenv('QUIETDASH_ASYNC', '0') == '1'
 
 # Log loaded configuration (without password)
 logging.info(f"Configuration loaded: API_URL={API_BASE_URL}, EMAIL={API_EMAIL}, REFRESH_INTERVAL={REFRESH_INTERVAL}s")
 
+# 1-bit conversion of PNG dashboards; threshold or bayer are plenty for text and charts
+DITHER = DITHER_ALGORITHM
+if DITHER not in ALGORITHMS:
+    logging.warning(f"Unknown QUIETDASH_DITHER '{DITHER}', using {FLOYD_STEINBERG} (choices: {', '.join(ALGORITHMS)})")
+    DITHER = FLOYD_STEINBERG
+
+# Fonts tried, in order, for the local fallback dashboard
+FALLBACK_FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+    '/System/Library/Fonts/Helvetica.ttc',
+]
+
+# Returned by fetch_image when the server reports the dashboard is unchanged (HTTP 304)
+NOT_MODIFIED = object()
+
+# Packed API frame ready to be pushed, with the HTTP validators it was served with; frames patched
+# from a tile delta also carry the changed rectangles and the hash of the frame they were patched from
+PreparedFrame = namedtuple('PreparedFrame', ['buffer', 'etag', 'last_modified', 'changed', 'base_hash'],
+                           defaults=(None, None))
+
 class QuietDashDisplay:
     """Manages the QuietDash.io e-ink display"""
 
-    def __init__(self):
+    def __init__(self, name=None, email=API_EMAIL, password=API_PASSWORD, dashboard_id=DASHBOARD_ID,
+                 device=DEFAULT_DEVICE, dither=None, session=None, token_cache=None, tokens=None, push_wake=None):
+        """
+        Args:
+            name: Panel name in multi-panel mode; its state lives in QUIETDASH_STATE_DIR/<name>
+            email: Account email
+            password: Account password
+            dashboard_id: Dashboard to request, or None for the account's default
+            device: Waveshare driver module driving this panel (waveshare_epd.<device>)
+            dither: 1-bit conversion of this panel's PNG dashboards (see dithering.py), None for QUIETDASH_DITHER
+            session: requests.Session to share a connection pool with other panels
+            token_cache: TokenCache to share with other panels
+            tokens: TokenManager to share with other panels logging in with the same account
+            push_wake: threading.Event also set on push events, for loops serving several panels
+        """
+        self.name = name
+        self.email = email
+        self.password = password
+        self.dashboard_id = dashboard_id
+        self.device = device
+        self.dither = dither or DITHER
+        self.push_wake = push_wake
+        # Per-stage timings and counters, labelled with the panel name in multi-panel mode
+        self.metrics = METRICS.for_panel(name)
         self.epd = None
-        self.access_token = None
-        self.session = requests.Session()
+        self.session = session or requests.Session()
+        # One receive buffer reused by every image download
+        self.download_buffer = DownloadBuffer()
+        # Picks the cheapest image representation from measured bytes and decode time
+        self.formats = FormatNegotiator(fmt for fmt in MEDIA_RANGES if RAW_FRAMES or fmt != PACKED)
+        # (format, transferred bytes, decode seconds) of the image returned by the last fetch
+        self.pending_transfer = None
+        # Last packed payload received (wire orientation), patched in place by tile deltas,
+        # with its hex SHA-256 sent as the delta base and the hash of the panel buffer made from it
+        self.delta_base = None
+        self.delta_base_hash = None
+        self.delta_base_panel_hash = None
+        # Rectangles patched by the tile delta returned by the last fetch (panel orientation)
+        self.pending_delta = None
+        # Reuse the token persisted by a previous run unless it is about to expire
+        self.token_cache = token_cache or TokenCache()
+        self.tokens = tokens or TokenManager(API_BASE_URL, self.email, self.token_cache)
+        self.login_lock = self.tokens.lock
+        self.push_listener = None
+        # PanelWriter shared by the panels of this process (None = frames are shown by the update loop)
+        self.writer = None
+        self.frame_store = FrameStore(os.path.join(STATE_DIR, name)) if name else FrameStore()
+        self.refresher = None
         self.display_width = None
         self.display_height = None
+        # Bit polarity of epd.getbuffer output, so packed frames can be matched to it
+        self.panel_black_is_one = True
+        # Guards what the panel shows (validators, restored frame), written by the panel writer
+        # thread and read by the update loop building the next request
+        self.shown_lock = threading.Lock()
+        # HTTP cache validators of the image currently shown on the panel
+        self.etag = None
+        self.last_modified = None
+        self.pending_validators = (None, None)
+        # Last good frame pushed at boot, until the API has been reached again
+        self.restored_hash = None
+        self.last_good_key = None
+        self.last_good_confirmed = None
+        # Learns how often the dashboard changes to pick the next polling delay
+        self.scheduler = create_scheduler(REFRESH_INTERVAL)
+        # Backoff and circuit breaker for API outages
+        self.breaker = CircuitBreaker()
+        # Turns polling delays into deadlines, aligned to wall-clock boundaries if configured
+        self.clock = RefreshClock()
+        # Outcome of the last show_api_frame call ('full', 'fast', 'partial', 'skipped' or None)
+        self.last_refresh = None
+        # True while the panel shows the local fallback dashboard
+        self.fallback_active = False
+        # Fallback dashboard: fonts and static layout are rendered once, then only the clock changes
+        self.fallback_fonts = None
+        self.fallback_base = None
+        self.fallback_frame = None
+
+    @property
+    def access_token(self):
+        return self.tokens.access_token
+
+    @access_token.setter
+    def access_token(self, token):
+        self.tokens.access_token = token
 
     def login(self):
+        """Authenticate with the QuietDash.io API and cache the access token for later restarts"""
+        with self.login_lock:
+            with self.metrics.timer('login'):
+                logged_in = self._login()
+            if not logged_in:
+                return False
+            self.token_cache.save(API_BASE_URL, self.email, self.access_token)
+        return True
+
+    def ensure_token(self):
+        """Make sure a usable access token is available, logging in only if needed"""
+        if token_is_fresh(self.access_token):
+            return True
+        with self.login_lock:
+            # Another thread, panel or process may have logged in while we waited for the lock
+            if self.tokens.reload():
+                return True
+            if self.access_token:
+                logging.info("Access token close to expiry, renewing...")
+            return self.login()
+
+    def start_token_renewal(self):
+        """Renew the access token in the background shortly before it expires"""
+        self.tokens.start_renewal(self.login)
+
+    def start_push_listener(self):
+        """Listen for server-pushed content changes in the background"""
+        if self.push_listener is None:
+            self.push_listener = PushListener(
+                f'{API_BASE_URL}/display/events',
+                lambda: {'Authorization': f'Bearer {self.access_token}'},
+                on_unauthorized=self.login,
+                wake=self.push_wake,
+            )
+            self.push_listener.start()
+
+    def wait_for_change(self, timeout):
+        """
+        Sleep until the next scheduled refresh, or earlier if the server pushes new content
+
+        Returns:
+            True if woken up by a push event
+        """
+        if self.push_listener is None:
+            time.sleep(timeout)
+            return False
+        return self.push_listener.wait(timeout)
+
+    def _login(self):
         """Authenticate with the QuietDash.io API and get access token"""
         try:
             login_url = f'{API_BASE_URL}/auth/login'
             login_data = {
-                'email': API_EMAIL,
-                'password': API_PASSWORD
+                'email': self.email,
+                'password': self.password
             }
             logging.info(f"Logging in to {login_url}")
-            logging.info(f"Sending JSON body: {{'email': '{API_EMAIL}', 'password': '***'}}")
+            logging.info(f"Sending JSON body: {{'email': '{self.email}', 'password': '***'}}")
             
             # Explicitly set headers to ensure JSON content type
             headers = {
@@ -113,43 +300,79 @@ class QuietDashDisplay:
                     pass
             return False
 
+    def image_request_headers(self):
+        """Headers of the image request: token, accepted formats and codings, cache validators and delta base"""
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Accept': self.formats.accept_header(),
+            'Accept-Encoding': CONTENT_ENCODINGS,
+        }
+        with self.shown_lock:
+            etag, last_modified = self.etag, self.last_modified
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        if DELTA_FRAMES and self.delta_base is not None:
+            headers['A-IM'] = DELTA_IM
+            headers['X-QuietDash-Base-Frame'] = self.delta_base_hash
+        return headers
+
+    def image_request_params(self):
+        """Query parameters of the image request"""
+        return {'dashboardId': self.dashboard_id} if self.dashboard_id else None
+
+    def _request_image(self):
+        """Issue the GET for the display image, sending any stored cache validators"""
+        return self.session.get(
+            f'{API_BASE_URL}/display/image',
+            params=self.image_request_params(),
+            headers=self.image_request_headers(),
+            timeout=30,
+            stream=True
+        )
+
     def fetch_image(self):
-        """Fetch the dashboard image from the API"""
-        if not self.access_token:
-            logging.warning("No access token, attempting to login...")
-            if not self.login():
-                return None
+        """
+        Fetch the dashboard image from the API
+
+        Returns:
+            PIL Image, or PackedFrame if the server sent a pre-packed frame,
+            NOT_MODIFIED if the server answered 304 for the image currently on the panel,
+            or None on failure
+        """
+        if not self.ensure_token():
+            return None
 
+        response = None
         try:
             logging.info(f"Fetching display image from {API_BASE_URL}/display/image")
-            response = self.session.get(
-                f'{API_BASE_URL}/display/image',
-                headers={
-                    'Authorization': f'Bearer {self.access_token}'
-                },
-                timeout=30
-            )
+            with self.metrics.timer('http'):
+                response = self._request_image()
 
             # If unauthorized, try to re-login once
             if response.status_code == 401:
-                logging.warning("Token expired, re-authenticating...")
+                logging.warning("Token rejected, re-authenticating...")
+                response.close()
+                self.token_cache.save(API_BASE_URL, self.email, None)
                 if self.login():
-                    response = self.session.get(
-                        f'{API_BASE_URL}/display/image',
-                        headers={
-                            'Authorization': f'Bearer {self.access_token}'
-                        },
-                        timeout=30
-                    )
+                    with self.metrics.timer('http'):
+                        response = self._request_image()
                 else:
                     return None
 
+            if response.status_code == 304:
+                return self.not_modified()
+
             response.raise_for_status()
 
-            # Load image from response
-            image = Image.open(BytesIO(response.content))
-            logging.info(f"Successfully fetched image: {image.size} {image.mode}")
-            return image
+            # Stream the body into the reusable buffer and decode straight from it
+            with self.metrics.timer('download'):
+                body = self.download_buffer.read_response(response)
+            # Bytes as transferred: compressed bodies are inflated while they are streamed
+            return self.decode_image(
+                body, response.headers, response.raw.tell(), 'X-QuietDash-Base-Frame' in response.request.headers,
+            )
 
         except requests.exceptions.RequestException as e:
             logging.error(f"Failed to fetch image: {e}")
@@ -157,14 +380,103 @@ class QuietDashDisplay:
         except Exception as e:
             logging.error(f"Failed to process image: {e}")
             return None
+        finally:
+            if response is not None:
+                response.close()
+
+    def not_modified(self):
+        """Account for a 304 answer to the image request; returns NOT_MODIFIED"""
+        logging.info("Dashboard image not modified since last update")
+        self.metrics.inc('not_modified_total')
+        return NOT_MODIFIED
+
+    def decode_image(self, body, headers, wire_bytes, sent_base):
+        """
+        Decode a downloaded image body (shared by the threaded and the asyncio runtimes)
+
+        Args:
+            body: Content-decoded body, only valid until the next download
+            headers: Case-insensitive response headers
+            wire_bytes: Body bytes as transferred
+            sent_base: True if the request offered a delta base
+
+        Returns:
+            PIL Image or PackedFrame; cache validators are left in pending_validators
+
+        Raises:
+            ValueError (or a PIL error) if the body cannot be decoded
+        """
+        encoding = headers.get('Content-Encoding', 'identity')
+        transfer = f"{wire_bytes} bytes transferred" + (f", {len(body)} {encoding}-decoded" if encoding != 'identity' else "")
+        content_type = headers.get('Content-Type', '').split(';')[0].strip()
+        decode_start = time.perf_counter()
+        self.pending_delta = None
+        if content_type == DELTA_CONTENT_TYPE:
+            with self.metrics.timer('decode', format='delta'):
+                image = self.apply_frame_delta(body)
+            fmt = PACKED
+            logging.info(f"Successfully patched {len(self.pending_delta)} changed tiles into the cached frame ({transfer})")
+        elif content_type == FRAME_CONTENT_TYPE:
+            with self.metrics.timer('decode', format='packed'):
+                image = parse_frame(body)
+                if DELTA_FRAMES:
+                    self.delta_base = bytearray(image.payload)
+                    self.delta_base_hash = payload_hash(self.delta_base).hex()
+            fmt = PACKED
+            logging.info(f"Successfully fetched packed frame: {image.width}x{image.height}, rotation {image.rotation} ({transfer})")
+        else:
+            # Decode now: the buffer is overwritten by the next download
+            with self.metrics.timer('decode', format='png'):
+                image = Image.open(MemoryReader(body))
+                image.load()
+            fmt = response_format(content_type, image.mode)
+            logging.info(f"Successfully fetched image: {image.size} {image.mode} ({transfer})")
+        self.pending_transfer = (fmt, wire_bytes, time.perf_counter() - decode_start)
+        if DELTA_FRAMES and fmt == PACKED and not sent_base:
+            # Seeds the delta cache: one-off, later packed frames normally arrive as tile deltas
+            self.pending_transfer = None
+        self.metrics.inc('http_bytes_total', wire_bytes, format='delta' if self.pending_delta is not None else fmt,
+                         encoding=encoding)
+
+        # Only committed once the image is actually on the panel (see show_api_frame)
+        self.pending_validators = (headers.get('ETag'), headers.get('Last-Modified'))
+        return image
+
+    def apply_frame_delta(self, body):
+        """
+        Patch a tile delta into the cached packed frame
+
+        Returns:
+            PackedFrame over the patched cache; the patched rectangles are left in pending_delta
+
+        Raises:
+            ValueError if the delta is invalid or does not apply; the cache is then dropped so
+            the next request asks for a full frame
+        """
+        delta = parse_delta(body)
+        if self.delta_base is None:
+            raise ValueError("Received a tile delta without a cached base frame")
+        try:
+            rects = apply_delta(self.delta_base, delta)
+        except ValueError:
+            self.delta_base = self.delta_base_hash = self.delta_base_panel_hash = None
+            raise
+        self.delta_base_hash = delta.result_hash.hex()
+        if delta.rotation == 180:
+            rects = rotate_rects_180(rects, delta.width, delta.height)
+        self.pending_delta = rects
+        return PackedFrame(delta.width, delta.height, delta.rotation, delta.flags, memoryview(self.delta_base))
 
     def init_display(self):
         """Initialize the e-Paper display"""
         try:
-            logging.info("Initializing 7.5inch e-Paper V2 display")
-            self.epd = epd7in5_V2.EPD()
+            logging.info(f"Initializing {self.device} e-Paper display" + (f" for panel '{self.name}'" if self.name else ""))
+            self.epd = create_panel(self.device, self.name)
             logging.info("init and Clear")
-            self.epd.init()
+            self.refresher = PartialRefresher(self.epd, self.frame_store, metrics=self.metrics)
+            # Wake the controller once up front so a missing or miswired panel is reported right away;
+            # later refreshes only re-initialize it when they need another mode
+            self.refresher.enter_mode(MODE_FULL)
             
             # Get display dimensions from the EPD object (as per Waveshare example)
             # The example uses epd.width and epd.height directly
@@ -172,6 +484,10 @@ class QuietDashDisplay:
             self.display_height = self.epd.height
             
             logging.info(f"Display dimensions: {self.display_width}x{self.display_height}")
+
+            # Probe once how the driver packs pixels (the V2 driver sets bits for black)
+            white = self.epd.getbuffer(Image.new('1', (self.display_width, self.display_height), 255))
+            self.panel_black_is_one = white[0] == 0x00
             
             # Skip initial clear - epd.Clear() can hang in some cases
             # The first image will overwrite whatever is on the display anyway
@@ -184,117 +500,137 @@ class QuietDashDisplay:
             logging.error(traceback.format_exc())
             return False
 
+    def load_fallback_fonts(self):
+        """Load the fallback dashboard fonts once (large, medium, small)"""
+        if self.fallback_fonts is not None:
+            return self.fallback_fonts
+
+        # Try to load fonts, fallback to default if not available
+        for font_path in FALLBACK_FONT_PATHS:
+            try:
+                self.fallback_fonts = (
+                    ImageFont.truetype(font_path, 35),
+                    ImageFont.truetype(font_path, 24),
+                    ImageFont.truetype(font_path, 18),
+                )
+                break
+            except OSError:
+                continue
+        else:
+            logging.warning("Could not load custom fonts, using default")
+            default = ImageFont.load_default()
+            self.fallback_fonts = (default, default, default)
+        return self.fallback_fonts
+
+    def render_fallback_base(self):
+        """Render the static part of the fallback dashboard: title, separator and widget boxes"""
+        font_large, font_medium, font_small = self.load_fallback_fonts()
+
+        # Create a new 1-bit image (255 = white background) - ensure exact dimensions
+        Himage = Image.new('1', (self.display_width, self.display_height), 255)
+        draw = ImageDraw.Draw(Himage)
+
+        # Draw title
+        draw.text((10, 0), 'QuietDash.io Dashboard', font=font_medium, fill=0)
+
+        # Draw separator line
+        draw.line((10, 110, self.display_width - 10, 110), fill=0)
+
+        # Draw widget boxes and content
+        y_start = 120
+        padding = 10
+
+        # Time/Date widget box (time and date are filled in by the clock regions)
+        draw.rectangle((padding, y_start, self.display_width // 2 - padding, y_start + 100), outline=0)
+        draw.text((padding + 5, y_start + 5), 'Time & Date', font=font_small, fill=0)
+
+        # Weather widget box (placeholder)
+        draw.rectangle((self.display_width // 2 + padding, y_start, self.display_width - padding, y_start + 100), outline=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 5), 'Weather', font=font_small, fill=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 30), 'Configure API key', font=font_small, fill=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 50), 'to see weather', font=font_small, fill=0)
+
+        # Calendar widget box (placeholder)
+        draw.rectangle((padding, y_start + 110, self.display_width // 2 - padding, y_start + 200), outline=0)
+        draw.text((padding + 5, y_start + 115), 'Calendar', font=font_small, fill=0)
+        draw.text((padding + 5, y_start + 140), 'Configure Google', font=font_small, fill=0)
+        draw.text((padding + 5, y_start + 160), 'Calendar API', font=font_small, fill=0)
+
+        # News widget box (placeholder)
+        draw.rectangle((self.display_width // 2 + padding, y_start + 110, self.display_width - padding, y_start + 200), outline=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 115), 'News', font=font_small, fill=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 140), 'Configure RSS', font=font_small, fill=0)
+        draw.text((self.display_width // 2 + padding + 5, y_start + 160), 'feed URL', font=font_small, fill=0)
+
+        # Draw some decorative lines
+        draw.line((20, y_start + 220, 70, y_start + 250), fill=0)
+        draw.line((70, y_start + 220, 20, y_start + 250), fill=0)
+        draw.rectangle((20, y_start + 220, 70, y_start + 250), outline=0)
+
+        return Himage
+
+    def fallback_clock_regions(self):
+        """
+        Regions of the fallback dashboard that change with the time
+
+        Returns:
+            list of (box, texts): box is a (left, top, right, bottom) crop box, right/bottom
+            exclusive so the separator and box outlines around it are never touched;
+            texts are (position, font, strftime format) tuples drawn inside it
+        """
+        font_large, font_medium, font_small = self.load_fallback_fonts()
+        # Minute resolution: during an outage only the clock is updated, once a minute
+        return [
+            # Header time and date, above the separator line
+            ((10, 30, self.display_width - 10, 110), [
+                ((10, 30), font_large, '%H:%M'),
+                ((10, 70), font_medium, '%A, %B %d'),
+            ]),
+            # Inside the Time & Date widget box
+            ((11, 150, self.display_width // 2 - 10, 220), [
+                ((15, 150), font_medium, '%H:%M'),
+                ((15, 180), font_small, '%A, %B %d'),
+            ]),
+        ]
+
     def draw_dashboard(self):
-        """Draw dashboard directly on the e-Paper display"""
+        """
+        Draw the local fallback dashboard on the e-Paper display
+
+        The static layout is rendered once and cached; each call only re-renders the
+        time/date regions into the cached frame, which the refresher then turns into a
+        partial refresh of the clock.
+        """
         if not self.epd:
             logging.error("Display not initialized")
             return False
 
         try:
-            logging.info("Drawing on the Horizontal image...")
-            self.epd.init_fast()
-            
-            # Clear display first to remove any previous content/borders
-            logging.info("Clearing display...")
-            try:
-                self.epd.Clear()
-            except Exception as e:
-                logging.warning(f"Could not clear display: {e}, continuing anyway...")
-            
-            # Create a new 1-bit image (255 = white background) - ensure exact dimensions
-            Himage = Image.new('1', (self.display_width, self.display_height), 255)
-            draw = ImageDraw.Draw(Himage)
-            
-            # Try to load fonts, fallback to default if not available
-            try:
-                # Try to find a font file (common locations)
-                font_paths = [
-                    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-                    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
-                    '/System/Library/Fonts/Helvetica.ttc',
-                ]
-                font_large = None
-                font_medium = None
-                font_small = None
-                
-                for font_path in font_paths:
-                    if os.path.exists(font_path):
-                        try:
-                            font_large = ImageFont.truetype(font_path, 35)
-                            font_medium = ImageFont.truetype(font_path, 24)
-                            font_small = ImageFont.truetype(font_path, 18)
-                            break
-                        except:
-                            continue
-                
-                if font_large is None:
-                    # Use default font if no font file found
-                    font_large = ImageFont.load_default()
-                    font_medium = ImageFont.load_default()
-                    font_small = ImageFont.load_default()
-            except Exception as e:
-                logging.warning(f"Could not load custom fonts, using default: {e}")
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
+            start = time.perf_counter()
+            if self.fallback_base is None:
+                logging.info("Rendering the fallback dashboard layout...")
+                self.fallback_base = self.render_fallback_base()
+                self.fallback_frame = self.fallback_base.copy()
+
             # Get current time and date
             now = datetime.now()
-            time_str = now.strftime('%H:%M:%S')
-            date_str = now.strftime('%A, %B %d')
-            
-            # Draw title
-            draw.text((10, 0), 'QuietDash.io Dashboard', font=font_medium, fill=0)
-            
-            # Draw time and date
-            draw.text((10, 30), time_str, font=font_large, fill=0)
-            draw.text((10, 70), date_str, font=font_medium, fill=0)
-            
-            # Draw separator line
-            draw.line((10, 110, self.display_width - 10, 110), fill=0)
-            
-            # Draw widget boxes and content
-            y_start = 120
-            padding = 10
-            
-            # Time/Date widget box
-            draw.rectangle((padding, y_start, self.display_width // 2 - padding, y_start + 100), outline=0)
-            draw.text((padding + 5, y_start + 5), 'Time & Date', font=font_small, fill=0)
-            draw.text((padding + 5, y_start + 30), time_str, font=font_medium, fill=0)
-            draw.text((padding + 5, y_start + 60), date_str, font=font_small, fill=0)
-            
-            # Weather widget box (placeholder)
-            draw.rectangle((self.display_width // 2 + padding, y_start, self.display_width - padding, y_start + 100), outline=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 5), 'Weather', font=font_small, fill=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 30), 'Configure API key', font=font_small, fill=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 50), 'to see weather', font=font_small, fill=0)
-            
-            # Calendar widget box (placeholder)
-            draw.rectangle((padding, y_start + 110, self.display_width // 2 - padding, y_start + 200), outline=0)
-            draw.text((padding + 5, y_start + 115), 'Calendar', font=font_small, fill=0)
-            draw.text((padding + 5, y_start + 140), 'Configure Google', font=font_small, fill=0)
-            draw.text((padding + 5, y_start + 160), 'Calendar API', font=font_small, fill=0)
-            
-            # News widget box (placeholder)
-            draw.rectangle((self.display_width // 2 + padding, y_start + 110, self.display_width - padding, y_start + 200), outline=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 115), 'News', font=font_small, fill=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 140), 'Configure RSS', font=font_small, fill=0)
-            draw.text((self.display_width // 2 + padding + 5, y_start + 160), 'feed URL', font=font_small, fill=0)
-            
-            # Draw some decorative lines
-            draw.line((20, y_start + 220, 70, y_start + 250), fill=0)
-            draw.line((70, y_start + 220, 20, y_start + 250), fill=0)
-            draw.rectangle((20, y_start + 220, 70, y_start + 250), outline=0)
-            
-            # Verify image dimensions match display
-            if Himage.size != (self.display_width, self.display_height):
-                logging.warning(f"Image size {Himage.size} doesn't match display ({self.display_width}, {self.display_height}), resizing...")
-                Himage = Himage.resize((self.display_width, self.display_height), Image.Resampling.LANCZOS)
-            
-            # Display the image
-            logging.info(f"Displaying dashboard on e-Paper (image size: {Himage.size}, mode: {Himage.mode})...")
-            buffer = self.epd.getbuffer(Himage)
-            self.epd.display(buffer)
+            for box, texts in self.fallback_clock_regions():
+                # Start from the static background of the region; drawing on the crop clips the text to it
+                region = self.fallback_base.crop(box)
+                draw = ImageDraw.Draw(region)
+                for (x, y), font, fmt in texts:
+                    draw.text((x - box[0], y - box[1]), now.strftime(fmt), font=font, fill=0)
+                self.fallback_frame.paste(region, box[:2])
+
+            buffer = self.epd.getbuffer(self.fallback_frame)
+            self.metrics.observe('fallback_render', time.perf_counter() - start)
+            logging.info(f"Fallback dashboard rendered in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+            # Display the image (only the regions that changed since the last frame are refreshed,
+            # periodic full refreshes take care of leftover content/borders)
+            self.forget_validators()
+            self.refresher.show(buffer)
+            self.fallback_active = True
             logging.info("Dashboard displayed successfully")
             return True
 
@@ -303,29 +639,70 @@ class QuietDashDisplay:
             logging.error(traceback.format_exc())
             return False
 
-    def display_api_image(self):
-        """Fetch image from API and display it on the e-Paper"""
+    def prepare_api_frame(self):
+        """
+        Fetch the dashboard image and convert it to a packed frame, without touching the panel
+
+        Safe to run on a background thread while the panel is busy refreshing.
+
+        Returns:
+            PreparedFrame, NOT_MODIFIED if the panel already shows the latest dashboard, or None on failure
+        """
+        with self.metrics.timer('prepare'):
+            return self._prepare_api_frame()
+
+    def _prepare_api_frame(self):
+        """Untimed body of prepare_api_frame"""
         if not self.epd:
             logging.error("Display not initialized")
-            return False
+            return None
+
+        if not self.breaker.allow_request():
+            logging.info(f"API marked unavailable, next attempt in {self.breaker.time_until_retry():.0f}s")
+            return None
 
+        # Fetch image from API
+        return self.prepare_fetched_frame(self.fetch_image())
+
+    def prepare_fetched_frame(self, image):
+        """
+        Turn the result of fetch_image into a frame for the panel, recording the outcome with the breaker
+
+        Returns:
+            Same as prepare_api_frame
+        """
         try:
-            # Fetch image from API
-            image = self.fetch_image()
             if image is None:
                 logging.error("Failed to fetch image from API")
-                return False
+                self.metrics.inc('fetch_failures_total')
+                self.breaker.record_failure()
+                return None
+            self.breaker.record_success()
+            if image is NOT_MODIFIED:
+                return NOT_MODIFIED
+            etag, last_modified = self.pending_validators
+            convert_start = time.perf_counter()
 
-            logging.info(f"Fetched image from API: {image.size} {image.mode}")
+            if isinstance(image, PackedFrame):
+                # Already in panel format: no PIL work at all
+                if (image.width, image.height) != (self.display_width, self.display_height):
+                    logging.error(f"Packed frame is {image.width}x{image.height}, panel is {self.display_width}x{self.display_height}")
+                    return None
+                with self.metrics.timer('getbuffer'):
+                    buffer = to_panel_buffer(image, self.panel_black_is_one)
+                self.record_transfer(time.perf_counter() - convert_start)
+                base_hash, self.delta_base_panel_hash = self.delta_base_panel_hash, frame_hash(buffer)
+                if self.pending_delta is None:
+                    return PreparedFrame(buffer, etag, last_modified)
+                return PreparedFrame(buffer, etag, last_modified, self.pending_delta, base_hash)
 
-            # Initialize display
-            logging.info("Initializing display for image update...")
-            self.epd.init()
+            logging.info(f"Fetched image from API: {image.size} {image.mode}")
 
             # Ensure image is the correct size (800x480)
             if image.size != (self.display_width, self.display_height):
                 logging.warning(f"Image size {image.size} doesn't match display ({self.display_width}, {self.display_height}), resizing...")
-                image = image.resize((self.display_width, self.display_height), Image.Resampling.LANCZOS)
+                with self.metrics.timer('resize'):
+                    image = image.resize((self.display_width, self.display_height), Image.Resampling.LANCZOS)
 
             # Convert to 1-bit black and white mode for e-Paper
             # The e-Paper expects 1-bit mode (black and white only)
@@ -334,12 +711,57 @@ class QuietDashDisplay:
                 # First convert to grayscale if needed
                 if image.mode not in ('L', '1'):
                     image = image.convert('L')
-                # Then convert to 1-bit using dithering for better quality
-                image = image.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+                # Then convert to 1-bit with the panel's dithering (see dithering.py)
+                with self.metrics.timer('dither', algorithm=self.dither):
+                    image = dither(image, self.dither)
 
-            logging.info(f"Displaying image on e-Paper (size: {image.size}, mode: {image.mode})...")
-            buffer = self.epd.getbuffer(image)
-            self.epd.display(buffer)
+            with self.metrics.timer('getbuffer'):
+                buffer = self.epd.getbuffer(image)
+            self.record_transfer(time.perf_counter() - convert_start)
+            return PreparedFrame(buffer, etag, last_modified)
+
+        except Exception as e:
+            logging.error(f"Failed to prepare API image: {e}")
+            logging.error(traceback.format_exc())
+            return None
+
+    def record_transfer(self, convert_seconds):
+        """Feed the transfer and decode cost of the frame just prepared to the format negotiator"""
+        if self.pending_transfer is None:
+            return
+        fmt, wire_bytes, decode_seconds = self.pending_transfer
+        preferred = self.formats.preferred()
+        self.formats.record(fmt, wire_bytes, decode_seconds + convert_seconds)
+        if self.formats.preferred() != preferred:
+            logging.info(f"Asking for {self.formats.preferred()} frames next ({self.formats.describe()})")
+
+    def show_api_frame(self, frame):
+        """
+        Push a frame returned by prepare_api_frame to the panel
+
+        Returns:
+            True if the panel now shows the latest dashboard
+        """
+        self.last_refresh = None
+        if frame is None:
+            return False
+        if frame is NOT_MODIFIED:
+            logging.info("Panel already shows the latest dashboard, skipping refresh")
+            self.restored_hash = None
+            self.confirm_last_good()
+            self.last_refresh = 'skipped'
+            return True
+
+        try:
+            logging.info("Displaying image on e-Paper...")
+            # Patched tiles describe the whole change only if the panel still shows the delta's base frame
+            changed = frame.changed if frame.base_hash is not None and frame.base_hash == self.frame_store.last_hash else None
+            self.last_refresh = self.refresher.show(frame.buffer, changed=changed)
+            with self.shown_lock:
+                self.etag, self.last_modified = frame.etag, frame.last_modified
+                self.restored_hash = None
+                self.fallback_active = False
+            self.save_last_good(frame.buffer)
             logging.info("Image displayed successfully")
             return True
 
@@ -348,18 +770,143 @@ class QuietDashDisplay:
             logging.error(traceback.format_exc())
             return False
 
+    def display_api_image(self):
+        """Fetch image from API and display it on the e-Paper"""
+        return self.show_api_frame(self.prepare_api_frame())
+
+    def save_last_good(self, buffer):
+        """Persist the API frame now on the panel so the next boot can show it instantly"""
+        key = (frame_hash(buffer), self.etag, self.last_modified)
+        if key == self.last_good_key:
+            self.confirm_last_good()
+            return
+        self.frame_store.save_last_good(
+            buffer,
+            width=self.display_width,
+            height=self.display_height,
+            etag=self.etag,
+            last_modified=self.last_modified,
+        )
+        self.last_good_key = key
+        self.last_good_confirmed = time.monotonic()
+
+    def confirm_last_good(self):
+        """The server still serves the last good frame: keep it fresh for restore_last_frame (throttled)"""
+        if self.last_good_key is None:
+            return
+        if self.last_good_confirmed is not None and time.monotonic() - self.last_good_confirmed < LAST_FRAME_CONFIRM_EVERY:
+            return
+        self.frame_store.confirm_last_good()
+        self.last_good_confirmed = time.monotonic()
+
+    def restore_last_frame(self):
+        """
+        Push the last good API frame to the panel before any network access
+
+        Returns:
+            True if a frame was restored
+        """
+        if not self.epd:
+            logging.error("Display not initialized")
+            return False
+
+        try:
+            buffer, meta = self.frame_store.load_last_good()
+            if buffer is None:
+                logging.info("No last good frame to restore")
+                return False
+            if (meta.get('width'), meta.get('height')) != (self.display_width, self.display_height):
+                logging.info("Last good frame was saved for another panel size, not restoring it")
+                return False
+            # Age since the server last served (or confirmed with a 304) this frame
+            age = time.time() - meta.get('confirmed_at', meta.get('saved_at', 0))
+            if age > LAST_FRAME_MAX_AGE:
+                logging.info(f"Last good frame is {int(age)}s old, not restoring it")
+                return False
+
+            logging.info(f"Restoring last good frame ({int(age)}s old)...")
+            self.refresher.show(buffer)
+            # The panel shows that API image again, so its validators apply to the first fetch
+            with self.shown_lock:
+                self.etag = meta.get('etag')
+                self.last_modified = meta.get('last_modified')
+                self.restored_hash = meta['hash']
+            self.last_good_key = (meta['hash'], self.etag, self.last_modified)
+            return True
+        except Exception as e:
+            logging.error(f"Failed to restore last good frame: {e}")
+            logging.error(traceback.format_exc())
+            return False
+
+    def observe_frame(self, frame):
+        """Feed the outcome of a poll (as returned by prepare_api_frame) to the polling scheduler"""
+        if frame is NOT_MODIFIED:
+            self.scheduler.observe_unchanged()
+        elif frame is not None:
+            if self.scheduler.observe(frame_hash(frame.buffer)):
+                logging.info(f"Dashboard content changed ({self.scheduler.describe()})")
+
+    def next_poll_delay(self):
+        """Seconds until the next poll, or until the fallback clock needs updating"""
+        delay = self.scheduler.next_interval()
+        # While the API fails, retries follow the breaker's backoff instead
+        retry = self.breaker.time_until_retry()
+        if retry is not None:
+            delay = retry
+        if self.fallback_active:
+            delay = min(delay, 60 - time.time() % 60 + 0.5)
+        return delay
+
+    def next_update_at(self, previous=None):
+        """
+        Monotonic time at which the next update should start
+
+        Args:
+            previous: Deadline of the update that just ran, to keep a fixed cadence without alignment
+
+        Returns:
+            Deadline for the next poll, moved to the next wall-clock boundary if QUIETDASH_REFRESH_ALIGN
+            is set; backoff retries and the fallback clock keep their own timing
+        """
+        # Backoff retries and the fallback clock are measured from now: counted from the previous
+        # deadline, a slow failed fetch would use up the backoff and the clock would redraw early
+        own_timing = self.breaker.time_until_retry() is not None or self.fallback_active
+        if own_timing:
+            previous = None
+        return self.clock.deadline(self.next_poll_delay(), previous, align=not own_timing)
+
+    def record_update_time(self, seconds):
+        """Feed the duration of an update that refreshed the panel to the refresh clock"""
+        # Only refreshes count: a 304 or an identical frame is much quicker and would shrink the lead
+        if self.last_refresh in ('full', 'fast', 'partial'):
+            self.clock.record(seconds)
+
+    def showing_restored_frame(self):
+        """True while the panel still shows the frame restored at boot and the API was not reached yet"""
+        return self.restored_hash is not None and self.frame_store.last_hash == self.restored_hash
+
+    def forget_validators(self):
+        """Drop cache validators once the panel no longer shows the API image"""
+        with self.shown_lock:
+            self.etag = None
+            self.last_modified = None
+
     def clear_display(self):
         """Clear the display by showing a white image (following Waveshare example pattern)"""
         if not self.epd:
             logging.error("Display not initialized")
             return False
         
+        # Whatever happens below, the panel no longer shows the API image
+        self.forget_validators()
+        self.frame_store.forget()
+
         try:
             # First try epd.Clear() as shown in Waveshare example
             # This may work better than displaying a white image
             logging.info("Attempting to clear display using epd.Clear()...")
             try:
-                self.epd.Clear()
+                self.refresher.clear()
                 logging.info("Display cleared using epd.Clear() (took a few seconds)")
                 return True
             except Exception as clear_error:
@@ -373,7 +920,7 @@ class QuietDashDisplay:
                 logging.info("Sending buffer to display (this may take 2-5 seconds - please wait)...")
                 # E-Paper displays can take several seconds to update - this is normal!
                 # The display() call blocks until the update is complete
-                self.epd.display(buffer)
+                self.refresher.show(buffer, force_full=True)
                 logging.info("Display cleared successfully (update complete)")
                 return True
         except Exception as e:
@@ -397,12 +944,11 @@ class QuietDashDisplay:
             logging.error("Display not initialized")
             return False
 
+        self.forget_validators()
+
         try:
             logging.info("Displaying shutdown message...")
 
-            # Initialize display
-            self.epd.init()
-
             # Create a white image
             image = Image.new('1', (self.display_width, self.display_height), 255)  # 255 = white
             draw = ImageDraw.Draw(image)
@@ -449,10 +995,10 @@ class QuietDashDisplay:
             # Draw the text in black on white background
             draw.text((x, y), message, font=font, fill=0)  # 0 = black
 
-            # Display the shutdown message
+            # Display the shutdown message with a full refresh so no ghosting stays on the idle panel
             logging.info("Showing shutdown message on e-Paper...")
             buffer = self.epd.getbuffer(image)
-            self.epd.display(buffer)
+            self.refresher.show(buffer, force_full=True)
             logging.info("Shutdown message displayed")
             return True
 
@@ -466,56 +1012,274 @@ class QuietDashDisplay:
         if self.epd:
             try:
                 logging.info("Putting display to sleep...")
-                self.epd.sleep()
+                self.refresher.sleep()
             except Exception as e:
                 logging.error(f"Failed to put display to sleep: {e}")
 
-    def cleanup(self):
-        """Clean up resources"""
-        # Display shutdown message before sleep
-        self.display_shutdown_message()
-        self.sleep()
+    def cleanup(self, panel=True):
+        """
+        Clean up resources
+
+        Args:
+            panel: Draw the shutdown message and put the panel to sleep; False when the panel
+                writer is still refreshing it, so the panel is not driven from two threads
+        """
+        self.tokens.stop_renewal()
+        if self.push_listener:
+            self.push_listener.stop()
+        if panel:
+            # Display shutdown message before sleep
+            self.display_shutdown_message()
+            self.sleep()
         self.session.close()
         logging.info("Cleanup complete")
 
+def update_panel(display, frame):
+    """Show a prepared API frame, or the local fallback dashboard if there is none"""
+    display.observe_frame(frame)
+    show_panel(display, frame)
+
+def show_panel(display, frame):
+    """Panel half of update_panel, run on the panel writer thread when there is one"""
+    try:
+        with display.metrics.timer('show'):
+            show_frame_or_fallback(display, frame)
+    finally:
+        METRICS.write_textfile()
+
+def show_frame_or_fallback(display, frame):
+    """Body of show_panel: the API frame if there is one, the restored frame or the fallback otherwise"""
+    if display.show_api_frame(frame):
+        return
+    if display.showing_restored_frame():
+        logging.warning("API not reachable yet, keeping the restored frame on the panel")
+        return
+    if display.fallback_active:
+        # Fallback already on screen: redrawing it only refreshes the clock region (partial refresh)
+        logging.info("API still unavailable, updating the fallback clock")
+    else:
+        logging.error("Failed to display API image, trying local fallback...")
+    # Fallback to local dashboard drawing if API fetch fails
+    if not display.draw_dashboard():
+        logging.error("Failed to draw fallback dashboard, will retry on next cycle")
+
+def keep_pending_frame(frame, pending):
+    """A failed or unchanged poll must not discard a fetched frame still waiting for the panel"""
+    return frame is None or frame is NOT_MODIFIED and pending is not None
+
+def present_frame(display, frame, started):
+    """
+    Show a frame returned by prepare_api_frame
+
+    With a panel writer the frame is handed over without waiting for the refresh, otherwise it is
+    shown right away; either way the update is measured from started until the panel is done.
+    """
+    if display.writer is None:
+        update_panel(display, frame)
+        display.record_update_time(time.monotonic() - started)
+        return
+    display.observe_frame(frame)
+    display.writer.submit(display, frame, started)
+
+def run_sequential(display):
+    """Fetch, convert and display, then sleep until the next refresh"""
+    deadline = time.monotonic()
+    while True:
+        started = time.monotonic()
+        present_frame(display, display.prepare_api_frame(), started)
+
+        # Wait for next refresh (or a push from the server); counted from this update's deadline,
+        # so fetch and refresh time do not add up to a drift
+        deadline = display.next_update_at(deadline)
+        delay = max(0, deadline - time.monotonic())
+        logging.info(f"Sleeping for {delay:.0f} seconds...")
+        if display.wait_for_change(delay):
+            # Pushed content restarts the cadence from now
+            deadline = time.monotonic()
+
+def run_pipelined(display):
+    """
+    Prefetch and convert the next frame PREFETCH_LEAD seconds before each refresh
+
+    The network works while the panel idles, so each refresh is only a buffer push at the scheduled time.
+    """
+    logging.info(f"Pipelined mode: prefetching {PREFETCH_LEAD}s ahead of each refresh")
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+    try:
+        pending = executor.submit(display.prepare_api_frame)
+        next_refresh = time.monotonic()
+        while True:
+            frame = pending.result()
+            present_frame(display, frame, time.monotonic())
+
+            # Don't try to catch up on refreshes missed while the panel was busy
+            next_refresh = display.next_update_at(next_refresh)
+            if display.wait_for_change(max(0, next_refresh - PREFETCH_LEAD - time.monotonic())):
+                # Pushed content is shown as soon as it is ready rather than at the next tick
+                next_refresh = time.monotonic()
+            pending = executor.submit(display.prepare_api_frame)
+            logging.info(f"Prefetching next frame, refresh in {max(0, next_refresh - time.monotonic()):.0f}s")
+            time.sleep(max(0, next_refresh - time.monotonic()))
+    finally:
+        executor.shutdown(wait=False)
+
+def run_panels(displays, wake):
+    """
+    Serve several panels from one loop: each is polled on its own schedule, one at a time
+
+    Args:
+        displays: Initialized QuietDashDisplay instances
+        wake: threading.Event set by their push listeners
+    """
+    if PREFETCH_LEAD > 0:
+        logging.info("QUIETDASH_PREFETCH_LEAD is ignored when driving several panels")
+    due = [time.monotonic()] * len(displays)
+    while True:
+        index = min(range(len(displays)), key=due.__getitem__)
+        delay = due[index] - time.monotonic()
+        if delay > 0:
+            if wake.wait(delay):
+                wake.clear()
+                # Pushed content is fetched right away for the panels whose dashboard changed
+                now = time.monotonic()
+                for i, display in enumerate(displays):
+                    if display.push_listener is not None and display.push_listener.changed.is_set():
+                        display.push_listener.changed.clear()
+                        due[i] = now
+            continue
+
+        display = displays[index]
+        logging.info(f"Updating panel '{display.name}'")
+        started = time.monotonic()
+        present_frame(display, display.prepare_api_frame(), started)
+        # Counted from this panel's deadline (or push), not from the end of its update
+        due[index] = display.next_update_at(due[index])
+
+def create_displays():
+    """
+    Build the panels this process drives
+
+    Returns:
+        (list of QuietDashDisplay, shared push wake-up Event or None for a single panel)
+    """
+    if not PANELS_FILE:
+        return [QuietDashDisplay()], None
+
+    panels = load_panels(PANELS_FILE)
+    logging.info(f"Driving {len(panels)} panels from {PANELS_FILE}: {', '.join(panel.name for panel in panels)}")
+    # One connection pool, token cache and wake-up event for all panels
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, 2 * len(panels)))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    token_cache = TokenCache()
+    # Panels logging in with the same account share its token, login and renewal
+    tokens = {}
+    for panel in panels:
+        if (panel.email, panel.password) not in tokens:
+            tokens[(panel.email, panel.password)] = TokenManager(API_BASE_URL, panel.email, token_cache)
+    wake = threading.Event()
+    displays = [
+        QuietDashDisplay(
+            name=panel.name, email=panel.email, password=panel.password,
+            dashboard_id=panel.dashboard_id, device=panel.device, dither=panel.dither,
+            session=session, token_cache=token_cache, tokens=tokens[(panel.email, panel.password)], push_wake=wake,
+        )
+        for panel in panels
+    ]
+    return displays, wake
+
+def start_display(display):
+    """Initialize a panel, restore its last frame and start its background helpers"""
+    # Initialize display
+    if not display.init_display():
+        return False
+
+    # Show the last good frame right away, without waiting for Wi-Fi or the API
+    display.restore_last_frame()
+
+    # Login to API (skipped when a still-valid token was persisted by a previous run);
+    # if the network is not up yet, the background renewer keeps trying
+    if not display.ensure_token():
+        logging.warning("Could not authenticate yet, will keep retrying in the background")
+    display.start_token_renewal()
+    if PUSH_ENABLED:
+        display.start_push_listener()
+    return True
+
+def run_async_runtime(displays):
+    """Run all panels on the asyncio runtime (see async_runtime.py)"""
+    try:
+        from async_runtime import run_async
+    except ImportError as e:
+        logging.error(f"QUIETDASH_ASYNC=1 needs aiohttp ({e}), install it with: pip install -r requirements-async.txt")
+        return 1
+    logging.info(f"Starting asyncio display runtime (refresh every {REFRESH_INTERVAL} seconds, "
+                 f"{displays[0].clock.describe()})")
+    return run_async(
+        displays, api_url=API_BASE_URL, update=update_panel,
+        prefetch_lead=PREFETCH_LEAD, push=PUSH_ENABLED,
+    )
+
+def handle_sigterm(signum, frame):
+    """Stop the service (systemctl stop) with the same graceful cleanup as Ctrl+C"""
+    raise KeyboardInterrupt
+
 def main():
     """Main function to run the display update loop"""
-    display = QuietDashDisplay()
+    try:
+        displays, wake = create_displays()
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not load panel configuration: {e}")
+        return 1
 
+    METRICS.serve()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    writer = None
     try:
-        # Initialize display
-        if not display.init_display():
+        if ASYNC_RUNTIME:
+            return run_async_runtime(displays)
+
+        running = [display for display in displays if start_display(display)]
+        if not running:
             logging.error("Failed to initialize display, exiting...")
             return 1
+        if len(running) < len(displays):
+            failed = [display.name for display in displays if display not in running]
+            logging.error(f"Failed to initialize panels {', '.join(failed)}, continuing without them")
 
-        # Login to API
-        if not display.login():
-            logging.error("Failed to authenticate, exiting...")
-            display.cleanup()
-            return 1
+        if PANEL_WRITER:
+            # One thread for all panels: a refresh never blocks fetches, and the SPI bus is never shared
+            writer = PanelWriter(show_panel, keep_pending=keep_pending_frame)
+            writer.start()
+            for display in running:
+                display.writer = writer
 
         # Main loop
-        logging.info(f"Starting display update loop (refresh every {REFRESH_INTERVAL} seconds)")
-
-        while True:
-            # Fetch and display image from API
-            if not display.display_api_image():
-                logging.error("Failed to display API image, trying local fallback...")
-                # Fallback to local dashboard drawing if API fetch fails
-                if not display.draw_dashboard():
-                    logging.error("Failed to draw fallback dashboard, will retry on next cycle")
-
-            # Wait for next refresh
-            logging.info(f"Sleeping for {REFRESH_INTERVAL} seconds...")
-            time.sleep(REFRESH_INTERVAL)
+        logging.info(f"Starting display update loop (refresh every {REFRESH_INTERVAL} seconds, "
+                     f"{running[0].clock.describe()})")
+        if wake is not None:
+            run_panels(running, wake)
+        elif PREFETCH_LEAD > 0:
+            run_pipelined(running[0])
+        else:
+            run_sequential(running[0])
 
     except KeyboardInterrupt:
-        logging.info("Interrupted by user (Ctrl+C)")
+        logging.info("Interrupted (Ctrl+C or service stop)")
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         logging.error(traceback.format_exc())
     finally:
-        display.cleanup()
+        # The stop signal may arrive twice (e.g. to the process and again to its group): don't let
+        # the second one cut the cleanup short; the writer wait below is bounded
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        # Let a refresh in progress finish before the shutdown message is drawn; if it is still
+        # running, leave the panels alone rather than drive them while the writer thread does
+        writer_stopped = writer is None or writer.stop()
+        for display in displays:
+            display.cleanup(panel=writer_stopped)
         logging.info("Exiting...")
 
     return 0
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Wall-clock aligned refresh scheduling for the QuietDash.io display client
+Refreshes land on fixed boundaries of the local clock (every :00 of the minute, every 5 minutes
+on the 5, ...) instead of drifting by the fetch and refresh time of every cycle. Deadlines are
+kept on the monotonic clock, and each update starts early by its measured duration so the panel
+finishes updating at the boundary.
+"""
+
+import os
+import time
+from collections import deque
+from statistics import median
+
+# Align refreshes to multiples of this many seconds of local time (60 = every minute on :00, 0 = off)
+REFRESH_ALIGN = int(os.getenv('QUIETDASH_REFRESH_ALIGN', '0'))
+
+# Number of measured update durations the start lead is estimated from
+DURATION_HISTORY = 5
+
+
+def next_boundary(delay, grid, lead=0.0, now=None):
+    """
+    Wall-clock time of the grid boundary closest to now + delay
+
+    Args:
+        delay: Wanted delay before the next refresh, in seconds
+        grid: Boundary spacing in seconds, counted from local midnight
+        lead: Seconds the update needs before the boundary; boundaries too close to make are skipped
+        now: Current time (defaults to time.time())
+
+    Returns:
+        time.time()-style timestamp of the boundary
+    """
+    now = time.time() if now is None else now
+    # Boundaries follow local time, so hourly grids stay on the hour in half-hour time zones
+    offset = time.localtime(now).tm_gmtoff
+    local_now = now + offset
+    ticks = max(round((local_now + delay) / grid), (local_now + lead) // grid + 1)
+    return ticks * grid - offset
+
+
+class RefreshClock:
+    """Turns polling delays into monotonic deadlines, optionally aligned to wall-clock boundaries"""
+
+    def __init__(self, grid=REFRESH_ALIGN, history=DURATION_HISTORY):
+        """
+        Args:
+            grid: Boundary spacing in seconds (0 = no alignment, deadlines are simply delays)
+            history: Number of update durations kept to estimate the start lead
+        """
+        self.grid = grid
+        self.durations = deque(maxlen=history)
+
+    @property
+    def lead(self):
+        """Seconds an update is started ahead of its boundary (median of the recent update durations)"""
+        if not self.durations:
+            return 0.0
+        # Never start more than half a period early, a slow outlier must not shift the whole schedule
+        return min(median(self.durations), self.grid / 2)
+
+    def record(self, seconds):
+        """Record how long an update took, from the start of its work until the panel finished"""
+        self.durations.append(seconds)
+
+    def deadline(self, delay, previous=None, align=True):
+        """
+        Monotonic time at which the next update should start
+
+        Args:
+            delay: Wanted delay before the next refresh, in seconds
+            previous: Deadline of the update that just ran; without alignment, the next one is
+                counted from it so the loop keeps a fixed cadence (None = count from now)
+            align: False for deadlines that must not move to a boundary (e.g. retries after failures)
+
+        Returns:
+            time.monotonic()-style deadline, never in the past
+        """
+        now = time.monotonic()
+        if not self.grid or not align:
+            start = now if previous is None else previous
+            return max(start + delay, now)
+        # The boundary is chosen on the wall clock, then converted once to the monotonic clock
+        wall_now = time.time()
+        lead = self.lead
+        boundary = next_boundary(delay, self.grid, lead, wall_now)
+        return now + (boundary - wall_now) - lead
+
+    def describe(self):
+        """Short human-readable state for the logs"""
+        if not self.grid:
+            return "not aligned"
+        return f"aligned to {self.grid}s boundaries, starting {self.lead:.1f}s early"
@@ -0,0 +1,526 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Local stand-in for the QuietDash.io API
+Serves /auth/login, /display/image (PNG, packed frames or tile deltas, see packed_frame.py) and the
+/display/events push stream so the display client can be exercised offline, without the NestJS
+API and its database. The image representation is negotiated from the Accept header (see
+format_negotiation.py) and compressed with gzip/deflate when Accept-Encoding allows it. Latency,
+failures, token expiry, payload size and 304 support are configurable so client-side network
+changes can be measured reproducibly (see load_harness.py).
+
+Usage:
+    python3 stand_in_server.py --port 3000 --change-interval 60
+    python3 stand_in_server.py --latency 0.3 --jitter 0.2 --failure-rate 0.1 --token-lifetime 600
+    QUIETDASH_API_URL=http://localhost:3000 QUIETDASH_PUSH=1 python3 quietdash_display.py
+"""
+
+import sys
+import json
+import time
+import zlib
+import gzip
+import base64
+import random
+import struct
+import logging
+import argparse
+import threading
+from io import BytesIO
+from datetime import datetime
+from collections import Counter, OrderedDict
+from email.utils import formatdate
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageDraw, ImageFont
+
+from packed_frame import (
+    DELTA_CONTENT_TYPE, DELTA_IM, FRAME_CONTENT_TYPE, FRAME_HEADER, encode_delta, encode_frame, payload_hash,
+)
+from format_negotiation import PACKED, PNG, PNG_1BIT, PNG_PALETTE
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Display constants
+DISPLAY_WIDTH = 800
+DISPLAY_HEIGHT = 480
+
+# Seconds between keepalive comments on the event stream
+KEEPALIVE_INTERVAL = 15
+
+# PNG bit depth requested through the depth parameter of image/png
+PNG_DEPTHS = {PNG_1BIT: '1', PNG_PALETTE: '4'}
+
+# ETag suffix of each representation (plain PNG keeps the bare version tag)
+ETAG_SUFFIXES = {PACKED: '-raw', PNG_1BIT: '-1bit', PNG_PALETTE: '-palette', PNG: ''}
+
+# Only compress bodies that shrink by at least this fraction (PNG data is already deflated)
+MIN_COMPRESSION_SAVING = 0.1
+
+# Packed frames kept as possible delta bases, per dashboard and version
+FRAME_HISTORY = 32
+
+
+def parse_quality_list(header):
+    """
+    Parse an Accept or Accept-Encoding header
+
+    Returns:
+        list of (value, parameters dict, q) tuples, values lower-cased
+    """
+    items = []
+    for item in (header or '').split(','):
+        parts = [part.strip() for part in item.split(';')]
+        if not parts[0]:
+            continue
+        params = {}
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition('=')
+            name, value = name.strip().lower(), value.strip().strip('"')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+            else:
+                params[name] = value
+        items.append((parts[0].lower(), params, quality))
+    return items
+
+
+def compress(body, coding):
+    """
+    Apply a content coding ('gzip', 'deflate' or 'identity')
+
+    Returns:
+        (body, coding actually applied): bodies that barely shrink are left uncompressed
+    """
+    if coding == 'identity':
+        return body, coding
+    compressed = gzip.compress(body, mtime=0) if coding == 'gzip' else zlib.compress(body)
+    if len(compressed) > len(body) * (1 - MIN_COMPRESSION_SAVING):
+        return body, 'identity'
+    return compressed, coding
+
+
+def make_token(email, lifetime):
+    """Build an unsigned JWT-shaped token carrying iat/exp claims"""
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b'=').decode()
+
+    now = int(time.time())
+    header = {'alg': 'none', 'typ': 'JWT'}
+    payload = {'sub': 'stand-in', 'email': email, 'iat': now, 'exp': now + lifetime}
+    return f'{encode(header)}.{encode(payload)}.stand-in'
+
+
+def pad_png(png, size):
+    """
+    Grow a PNG to at least size bytes with a private ancillary chunk
+
+    Decoders skip unknown ancillary chunks, so the image is unchanged; only the transfer gets bigger.
+    The padding is pseudo-random so that, like real image data, it does not compress away.
+    """
+    missing = size - len(png)
+    if missing <= 0:
+        return png
+    # Chunk overhead: length, type and CRC
+    data = random.Random(size).randbytes(max(0, missing - 12))
+    chunk_type = b'quPd'
+    chunk = struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+    # Insert right after the 8-byte signature and the 25-byte IHDR chunk
+    return png[:33] + chunk + png[33:]
+
+
+class StandInState:
+    """Content versioning, fault injection and request statistics shared by all request handlers"""
+
+    def __init__(self, change_interval, token_lifetime, raw_frames=True, latency=0.0, jitter=0.0,
+                 failure_rate=0.0, failure_status=503, payload_bytes=0, conditional=True, seed=None,
+                 png_variants=True, compression=True, deltas=True):
+        """
+        Args:
+            change_interval: Seconds between dashboard content changes
+            token_lifetime: Lifetime of issued access tokens; expired tokens get 401
+            raw_frames: Serve packed frames to clients that ask for them
+            latency: Seconds added before every /auth and /display/image response
+            jitter: Extra random latency, uniform between 0 and jitter seconds
+            failure_rate: Probability (0..1) of answering failure_status instead
+            failure_status: HTTP status of injected failures
+            payload_bytes: Pad PNG responses to at least this many bytes
+            conditional: Honour If-None-Match with 304 responses
+            seed: Seed of the fault injection random generator, for reproducible runs
+            png_variants: Serve 1-bit and palette PNGs to clients that ask for them
+            compression: Honour Accept-Encoding with gzip/deflate bodies
+            deltas: Answer clients that send the hash of an earlier packed frame with the changed tiles only
+        """
+        self.change_interval = change_interval
+        self.token_lifetime = token_lifetime
+        self.raw_frames = raw_frames
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.payload_bytes = payload_bytes
+        self.conditional = conditional
+        self.png_variants = png_variants
+        self.compression = compression
+        self.deltas = deltas
+        self.random = random.Random(seed)
+        # Access token -> expiry timestamp
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.rendered = {}
+        # (representation, content coding, dashboard) -> encoded body, for the current version
+        self.encoded = {}
+        # Payload hash (hex) -> packed payload of recent frames, oldest first
+        self.frame_history = OrderedDict()
+        # (path, status) -> responses, and response body bytes per path
+        self.stats = Counter()
+        self.bytes_sent = Counter()
+        # (representation, content coding) -> image bodies served
+        self.served = Counter()
+
+    def issue_token(self, email):
+        token = make_token(email, self.token_lifetime)
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+        return token
+
+    def token_valid(self, token):
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def delay(self):
+        """Sleep for the configured latency"""
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self):
+        with self.lock:
+            return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def record(self, path, status, size):
+        with self.lock:
+            self.stats[(path, status)] += 1
+            self.bytes_sent[path] += size
+
+    def version(self):
+        """Content version; bumps every change_interval seconds"""
+        return int(time.time() // self.change_interval)
+
+    def etag(self, version, representation=PNG, dashboard=None, encoding='identity'):
+        tag = f'v{version}' + (f'-d{dashboard}' if dashboard else '') + ETAG_SUFFIXES[representation]
+        if encoding != 'identity':
+            # Each content coding is a different representation, with its own validator
+            tag += f'-{encoding}'
+        return f'"{tag}"'
+
+    def representations(self):
+        """Representations this server offers, in its own order of preference"""
+        offered = [PACKED] if self.raw_frames else []
+        if self.png_variants:
+            offered += [PNG_1BIT, PNG_PALETTE]
+        return offered + [PNG]
+
+    def negotiate(self, accept):
+        """
+        Pick the representation for an Accept header
+
+        Packed frames and PNG depth variants are only sent to clients that name them explicitly;
+        anything else (including no Accept header) gets the plain PNG.
+        """
+        ranges = parse_quality_list(accept)
+        best, best_quality = PNG, 0.0
+        for representation in self.representations():
+            quality = 0.0
+            for media_type, params, q in ranges:
+                if representation == PACKED:
+                    matches = media_type == FRAME_CONTENT_TYPE
+                elif representation in PNG_DEPTHS:
+                    matches = media_type == 'image/png' and params.get('depth') == PNG_DEPTHS[representation]
+                else:
+                    matches = media_type in ('image/png', 'image/*', '*/*') and 'depth' not in params
+                if matches:
+                    quality = max(quality, q)
+            if quality > best_quality:
+                best, best_quality = representation, quality
+        return best
+
+    def content_coding(self, accept_encoding):
+        """Pick gzip or deflate from an Accept-Encoding header, 'identity' if neither is accepted"""
+        if not self.compression:
+            return 'identity'
+        best, best_quality = 'identity', 0.0
+        for coding, _, q in parse_quality_list(accept_encoding):
+            if coding in ('gzip', 'deflate') and q > best_quality:
+                best, best_quality = coding, q
+        return best
+
+    def encode(self, version, dashboard, representation, coding):
+        """
+        Body of a representation in a content coding (cached per version)
+
+        Returns:
+            (body, coding actually applied), see compress
+        """
+        body = self.render(version, dashboard)[representation]
+        key = (representation, coding, dashboard)
+        with self.lock:
+            if key not in self.encoded:
+                self.encoded[key] = compress(body, coding)
+            return self.encoded[key]
+
+    def delta(self, version, dashboard, base_hash):
+        """
+        Tile delta from a packed frame the client holds to the current one
+
+        Returns:
+            Delta body, or None if the base frame is unknown or the full frame would be smaller
+        """
+        packed = self.render(version, dashboard)[PACKED]
+        with self.lock:
+            base = self.frame_history.get(base_hash)
+        if base is None:
+            return None
+        body = encode_delta(base, packed[FRAME_HEADER.size:], DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        return body if len(body) < len(packed) else None
+
+    def last_modified(self, version):
+        return formatdate(version * self.change_interval, usegmt=True)
+
+    def render(self, version, dashboard=None):
+        """Render (once per version and dashboard) the dashboard PNG and packed frame for a content version"""
+        with self.lock:
+            # Drop renderings of older versions
+            self.rendered = {key: value for key, value in self.rendered.items() if key[0] == version}
+            if (version, dashboard) not in self.rendered:
+                self.encoded = {}
+                image = Image.new('L', (DISPLAY_WIDTH, DISPLAY_HEIGHT), 255)
+                draw = ImageDraw.Draw(image)
+                font = ImageFont.load_default()
+                stamp = datetime.fromtimestamp(version * self.change_interval)
+                draw.text((20, 20), 'QuietDash stand-in server', font=font, fill=0)
+                draw.text((20, 50), f'Content version {version}', font=font, fill=0)
+                draw.text((20, 80), stamp.strftime('%H:%M:%S'), font=font, fill=0)
+                if dashboard:
+                    draw.text((20, 100), f'Dashboard {dashboard}', font=font, fill=0)
+                draw.rectangle((20, 120, DISPLAY_WIDTH - 20, DISPLAY_HEIGHT - 20), outline=0, width=2)
+                bitmap = image.convert('1')
+                # PIL packs '1' images with set bits for white, i.e. flags=0
+                payload = bitmap.tobytes()
+                representations = {PACKED: encode_frame(payload, DISPLAY_WIDTH, DISPLAY_HEIGHT)}
+                self.frame_history[payload_hash(payload).hex()] = payload
+                while len(self.frame_history) > FRAME_HISTORY:
+                    self.frame_history.popitem(last=False)
+                for representation, source, options in (
+                    (PNG, image, {}),
+                    (PNG_1BIT, bitmap, {}),
+                    (PNG_PALETTE, image.quantize(16), {'bits': 4}),
+                ):
+                    buf = BytesIO()
+                    source.save(buf, format='PNG', **options)
+                    representations[representation] = pad_png(buf.getvalue(), self.payload_bytes)
+                self.rendered[(version, dashboard)] = representations
+            return self.rendered[(version, dashboard)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the QuietDash.io API endpoints used by the display client"""
+
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.state.record(urlsplit(self.path).path, status, len(body))
+
+    def _authorized(self):
+        auth = self.headers.get('Authorization', '')
+        token = auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+        return token is not None and self.state.token_valid(token)
+
+    def _inject_faults(self):
+        """Apply configured latency and failures; returns True if the request was answered with a failure"""
+        self.state.delay()
+        if self.state.should_fail():
+            self._send(self.state.failure_status, b'{"message":"Injected failure"}', headers={'Retry-After': '30'})
+            return True
+        return False
+
+    def do_POST(self):
+        if self.path != '/auth/login':
+            self._send(404, b'{"message":"Not Found"}')
+            return
+        length = int(self.headers.get('Content-Length', '0'))
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send(400, b'{"message":"Invalid JSON"}')
+            return
+        if self._inject_faults():
+            return
+        token = self.state.issue_token(data.get('email', ''))
+        body = json.dumps({'user': {'email': data.get('email')}, 'accessToken': token}).encode()
+        self._send(201, body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/display/image':
+            self.handle_image()
+        elif path == '/display/events':
+            self.handle_events()
+        else:
+            self._send(404, b'{"message":"Not Found"}')
+
+    def handle_image(self):
+        if self._inject_faults():
+            return
+        if not self._authorized():
+            self._send(401, b'{"message":"Unauthorized"}')
+            return
+        version = self.state.version()
+        dashboard = parse_qs(urlsplit(self.path).query).get('dashboardId', [None])[0]
+        representation = self.state.negotiate(self.headers.get('Accept'))
+        requested_coding = self.state.content_coding(self.headers.get('Accept-Encoding'))
+        body, coding = self.state.encode(version, dashboard, representation, requested_coding)
+        validators = {
+            'ETag': self.state.etag(version, representation, dashboard, coding),
+            'Last-Modified': self.state.last_modified(version),
+            'Vary': 'Accept, Accept-Encoding',
+        }
+        if self.state.conditional and self.headers.get('If-None-Match') == validators['ETag']:
+            self._send(304, headers=validators)
+            return
+        instance_manipulations = [im for im, _, q in parse_quality_list(self.headers.get('A-IM')) if q > 0]
+        if representation == PACKED and self.state.deltas and DELTA_IM in instance_manipulations:
+            delta = self.state.delta(version, dashboard, self.headers.get('X-QuietDash-Base-Frame', ''))
+            if delta is not None:
+                # The ETag stays the one of the full frame the delta reconstructs
+                delta, delta_coding = compress(delta, requested_coding)
+                headers = dict(validators, IM=DELTA_IM)
+                if delta_coding != 'identity':
+                    headers['Content-Encoding'] = delta_coding
+                self.state.served[('delta', delta_coding)] += 1
+                self._send(226, delta, content_type=DELTA_CONTENT_TYPE, headers=headers)
+                return
+        if coding != 'identity':
+            validators['Content-Encoding'] = coding
+        self.state.served[(representation, coding)] += 1
+        content_type = FRAME_CONTENT_TYPE if representation == PACKED else 'image/png'
+        self._send(200, body, content_type=content_type, headers=validators)
+
+    def handle_events(self):
+        if not self._authorized():
+            self._send(401, b'{"message":"Unauthorized"}')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.state.record(self.path, 200, 0)
+
+        version = self.state.version()
+        last_write = time.monotonic()
+        try:
+            while True:
+                time.sleep(1)
+                current = self.state.version()
+                if current != version:
+                    version = current
+                    self.wfile.write(f'event: update\ndata: {self.state.etag(version)}\n\n'.encode())
+                    self.wfile.flush()
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= KEEPALIVE_INTERVAL:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    last_write = time.monotonic()
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Event stream client disconnected")
+
+
+def create_server(state, host='127.0.0.1', port=3000):
+    """
+    Build a stand-in API server (port 0 picks a free port)
+
+    Returns:
+        ThreadingHTTPServer; run it with serve_forever(), e.g. on a background thread
+    """
+    handler = type('BoundStandInHandler', (StandInHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """Run the stand-in API server"""
+    parser = argparse.ArgumentParser(description='Local stand-in for the QuietDash.io API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--change-interval', type=float, default=60,
+                        help='Seconds between dashboard content changes')
+    parser.add_argument('--token-lifetime', type=int, default=7 * 24 * 3600,
+                        help='Access token lifetime in seconds')
+    parser.add_argument('--no-raw-frames', action='store_true',
+                        help='Always answer with PNG, ignoring requests for packed frames')
+    parser.add_argument('--no-png-variants', action='store_true',
+                        help='Ignore requests for 1-bit and palette PNGs')
+    parser.add_argument('--no-compression', action='store_true',
+                        help='Ignore Accept-Encoding and always send uncompressed bodies')
+    parser.add_argument('--no-deltas', action='store_true',
+                        help='Always send full packed frames, never tile deltas')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every login and image response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Extra random latency, up to this many seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction (0..1) of login and image requests answered with --failure-status')
+    parser.add_argument('--failure-status', type=int, default=503,
+                        help='HTTP status of injected failures')
+    parser.add_argument('--payload-bytes', type=int, default=0,
+                        help='Pad PNG responses to at least this many bytes')
+    parser.add_argument('--no-conditional', action='store_true',
+                        help='Ignore If-None-Match and always send the full image')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for latency jitter and failure injection')
+    args = parser.parse_args()
+
+    state = StandInState(
+        args.change_interval, args.token_lifetime, not args.no_raw_frames,
+        latency=args.latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, failure_status=args.failure_status,
+        payload_bytes=args.payload_bytes, conditional=not args.no_conditional, seed=args.seed,
+        png_variants=not args.no_png_variants, compression=not args.no_compression, deltas=not args.no_deltas,
+    )
+    server = create_server(state, args.host, args.port)
+    logging.info(f"Stand-in QuietDash API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Interrupted by user (Ctrl+C)")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
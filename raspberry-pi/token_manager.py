@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+JWT access token handling for the QuietDash.io display client
+Decodes token expiry, persists tokens across restarts and renews them ahead of time
+"""
+
+import os
+import json
+import time
+import base64
+import logging
+import threading
+
+from frame_store import STATE_DIR
+
+# Renew the access token this many seconds before it expires
+TOKEN_RENEW_MARGIN = int(os.getenv('QUIETDASH_TOKEN_RENEW_MARGIN', '3600'))
+
+# Wait this long before retrying a failed background renewal
+TOKEN_RETRY_INTERVAL = 60
+
+
+def token_claims(token):
+    """
+    Decode the claims of a JWT without verifying its signature
+
+    Args:
+        token: Encoded JWT (header.payload.signature)
+
+    Returns:
+        dict of claims, empty if the token cannot be decoded
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else {}
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return {}
+
+
+def renewal_due_at(token, margin=TOKEN_RENEW_MARGIN):
+    """
+    Compute when a token should be renewed
+
+    The margin is capped at half the token lifetime so short-lived tokens are not renewed in a loop.
+
+    Returns:
+        Unix timestamp, or None if the token carries no 'exp' claim
+    """
+    claims = token_claims(token)
+    try:
+        exp = float(claims['exp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    try:
+        margin = min(margin, (exp - float(claims['iat'])) / 2)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return exp - margin
+
+
+def token_is_fresh(token, margin=TOKEN_RENEW_MARGIN):
+    """Return True if token does not need renewing yet"""
+    if not token:
+        return False
+    due = renewal_due_at(token, margin)
+    # Tokens without an expiry are trusted until the API rejects them
+    return due is None or due > time.time()
+
+
+class TokenCache:
+    """Persists access tokens per API URL and account so restarts can skip /auth/login"""
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, 'tokens.json')
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(api_url, email):
+        return f'{api_url}|{email}'
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                tokens = json.load(f)
+            return tokens if isinstance(tokens, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read token cache {self.path}: {e}")
+            return {}
+
+    def _write(self, tokens):
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            # Tokens are credentials: keep the file private to the service user
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(tokens, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not persist token cache to {self.path}: {e}")
+
+    def load(self, api_url, email):
+        """Return the cached token for this account, or None"""
+        with self.lock:
+            return self._read().get(self._key(api_url, email))
+
+    def save(self, api_url, email, token):
+        """Cache token for this account (None removes it)"""
+        with self.lock:
+            tokens = self._read()
+            key = self._key(api_url, email)
+            if token:
+                tokens[key] = token
+            else:
+                tokens.pop(key, None)
+            self._write(tokens)
+
+
+class TokenRenewer(threading.Thread):
+    """Background thread that renews the access token shortly before it expires"""
+
+    def __init__(self, get_token, renew, margin=TOKEN_RENEW_MARGIN):
+        """
+        Args:
+            get_token: Callable returning the current access token (or None)
+            renew: Callable performing a login, returning True on success
+            margin: Seconds before expiry at which to renew
+        """
+        super().__init__(name='token-renewer', daemon=True)
+        self.get_token = get_token
+        self.renew = renew
+        self.margin = margin
+        self.stopped = threading.Event()
+
+    def seconds_until_renewal(self):
+        """Seconds to wait before the next renewal, None if the token never expires"""
+        token = self.get_token()
+        if not token:
+            return 0
+        due = renewal_due_at(token, self.margin)
+        if due is None:
+            return None
+        return max(0, due - time.time())
+
+    def run(self):
+        while not self.stopped.is_set():
+            delay = self.seconds_until_renewal()
+            if delay is None:
+                logging.info("Access token has no expiry, background renewal stopped")
+                return
+            if delay > 0:
+                self.stopped.wait(delay)
+                continue
+            logging.info("Access token close to expiry, renewing in the background...")
+            if not self.renew():
+                logging.warning(f"Background token renewal failed, retrying in {TOKEN_RETRY_INTERVAL}s")
+                self.stopped.wait(TOKEN_RETRY_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class TokenManager:
+    """Access token of one account, shared by every panel that logs in with it"""
+
+    def __init__(self, api_url, email, token_cache):
+        """
+        Args:
+            api_url: API base URL the token is valid for
+            email: Account email
+            token_cache: TokenCache persisting the token across restarts
+        """
+        self.api_url = api_url
+        self.email = email
+        self.token_cache = token_cache
+        # Held while logging in, so panels sharing the account log in once
+        self.lock = threading.RLock()
+        self.access_token = None
+        self.renewer = None
+        self.reload()
+
+    def reload(self):
+        """
+        Adopt the cached token if another panel or process renewed it in the meantime
+
+        Returns:
+            True if the current token does not need renewing yet
+        """
+        cached = self.token_cache.load(self.api_url, self.email)
+        if cached and cached != self.access_token and token_is_fresh(cached):
+            self.access_token = cached
+        return token_is_fresh(self.access_token)
+
+    def renew(self, login):
+        """Renew the token with login, unless a fresh one is already in the cache"""
+        with self.lock:
+            if self.reload():
+                logging.info("Using the access token renewed by another panel or process")
+                return True
+            return login()
+
+    def start_renewal(self, login):
+        """Renew the token in the background shortly before it expires (once per account)"""
+        with self.lock:
+            if self.renewer is None:
+                self.renewer = TokenRenewer(lambda: self.access_token, lambda: self.renew(login))
+                self.renewer.start()
+
+    def stop_renewal(self):
+        if self.renewer is not None:
+            self.renewer.stop()